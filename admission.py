@@ -0,0 +1,82 @@
+"""Контроль допуска запросов к скорингу (admission control).
+
+Ограничивает число одновременно принятых запросов (включая чтение и разбор тела),
+размер одного пакета и суммарное число строк в скоринге. Запрос, который не
+помещается, сразу получает отказ (413 или 429 с Retry-After), а не ждёт без
+ограничений и не уводит процесс в swap.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class AdmissionRejected(Exception):
+    """Запрос отклонён; status_code и retry_after передаются в HTTP-ответ."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """Истёк срок выполнения запроса — клиент уже не ждёт ответа."""
+
+
+def check_deadline(deadline: float = None):
+    if deadline is not None and time.monotonic() > deadline:
+        raise DeadlineExceeded("Истёк срок выполнения запроса")
+
+
+class AdmissionController:
+    def __init__(self, max_batch_rows: int, max_inflight_rows: int, max_queue_depth: int,
+                 retry_after: int = 1):
+        self.max_batch_rows = max_batch_rows
+        self.max_inflight_rows = max(max_inflight_rows, max_batch_rows)
+        self.max_queue_depth = max_queue_depth
+        self.retry_after = retry_after
+        self.inflight_rows = 0
+        self.active_requests = 0
+        self._cond = threading.Condition()
+
+    def _fits(self, rows: int) -> bool:
+        return self.inflight_rows + rows <= self.max_inflight_rows
+
+    @contextmanager
+    def request_slot(self):
+        """Место для запроса в очереди; при полной очереди — сразу отказ с кодом 429."""
+        with self._cond:
+            if self.active_requests >= self.max_queue_depth:
+                raise AdmissionRejected(429, "Сервис перегружен, повторите запрос позже", self.retry_after)
+            self.active_requests += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.active_requests -= 1
+
+    @contextmanager
+    def admit(self, rows: int, deadline: float = None):
+        """Резервирует rows строк на время выполнения блока with.
+
+        Если места нет, запрос ждёт освобождения строк до deadline.
+        """
+        if rows > self.max_batch_rows:
+            raise AdmissionRejected(
+                413, f"Слишком большой пакет: {rows} строк (максимум {self.max_batch_rows})")
+
+        with self._cond:
+            while not self._fits(rows):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise DeadlineExceeded("Истёк срок ожидания в очереди")
+                self._cond.wait(remaining)
+            self.inflight_rows += rows
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.inflight_rows -= rows
+                self._cond.notify_all()
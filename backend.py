@@ -1,27 +1,244 @@
-from typing import List
-from fastapi import FastAPI, HTTPException
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+# Начало импорта модуля — для разбивки времени старта
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import BackgroundTasks, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import joblib
+import numpy as np
 import pandas as pd
 
-app = FastAPI()
+from admission import AdmissionController, AdmissionRejected, DeadlineExceeded, check_deadline
+from http_compression import CompressionMiddleware
+import profiling
+from profiling import stage
+from result_store import ResultStore, csv_chunks, parquet_chunks
+from shadow import ShadowScorer
+
+logger = logging.getLogger("uvicorn.error")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Модели загружаются в фоне: сервер сразу отвечает на /health/live,
+    # а /health/ready и скоринг становятся доступны после прогрева
+    if STARTUP_MODE == "sequential":
+        prepare_models(sequential=True)
+    else:
+        threading.Thread(target=prepare_models, daemon=True).start()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Ограничения нагрузки (задаются переменными окружения)
+MAX_BATCH_ROWS = int(os.getenv("MAX_BATCH_ROWS", "250000"))
+MAX_INFLIGHT_ROWS = int(os.getenv("MAX_INFLIGHT_ROWS", "500000"))
+# Максимум одновременно принятых запросов к скорингу (обрабатываемых и ожидающих)
+MAX_QUEUE_DEPTH = int(os.getenv("MAX_QUEUE_DEPTH", "16"))
+MAX_BODY_MB = float(os.getenv("MAX_BODY_MB", "200"))
+# Максимум сжатого (gzip/zstd) тела: проверяется до распаковки
+MAX_COMPRESSED_BODY_MB = float(os.getenv("MAX_COMPRESSED_BODY_MB", "20"))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "60"))
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", "1"))
+# Разбивать ли слишком большие пакеты на части вместо отказа с кодом 413
+AUTO_SHARD = os.getenv("AUTO_SHARD", "0") == "1"
+# Токен для /admin/* (заголовок X-Admin-Token); пустой — без проверки
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+admission = AdmissionController(MAX_BATCH_ROWS, MAX_INFLIGHT_ROWS, MAX_QUEUE_DEPTH, RETRY_AFTER_SECONDS)
+
+# Ответы меньше этого размера (байт) не сжимаются
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+# Распаковка тел gzip/zstd, ограничение тел без Content-Length (chunked) и сжатие ответов;
+# добавлена раньше limit_scoring_load, поэтому выполняется внутри него — после проверки
+# заголовка Content-Length и допуска, но до разбора тела
+app.add_middleware(CompressionMiddleware, max_body_bytes=int(MAX_BODY_MB * 1024 * 1024),
+                   max_compressed_bytes=int(MAX_COMPRESSED_BODY_MB * 1024 * 1024),
+                   minimum_size=COMPRESS_MIN_BYTES)
+
+# Файлы моделей для каждой страны
+MODEL_PATHS = {
+    "France": "models/model_france.pkl",
+    "Spain": "models/model_spain.pkl",
+    "Germany": "models/model_germany.pkl",
+}
+
+# Уровни моделей: full — полные модели, fast — компактные (дистиллированные)
+# модели <папка MODEL_PATHS>/model_<страна>_fast.pkl (train_models/distill_models.py)
+MODEL_TIERS = ("full", "fast")
+# Компактная модель не загружается, если её ROC-AUC ниже, чем у полной, больше чем на MAX_AUC_LOSS
+MAX_AUC_LOSS = float(os.getenv("MAX_AUC_LOSS", "0.01"))
+
+# Модели-претенденты для теневого скоринга: <CHALLENGER_DIR>/challenger_<страна>.pkl (необязательны)
+CHALLENGER_DIR = os.getenv("CHALLENGER_DIR", "models")
+# Потоков и заданий в очереди теневого скоринга; потоков xgboost на одно предсказание претендента
+SHADOW_WORKERS = int(os.getenv("SHADOW_WORKERS", "1"))
+SHADOW_QUEUE = int(os.getenv("SHADOW_QUEUE", "8"))
+SHADOW_NTHREAD = int(os.getenv("SHADOW_NTHREAD", "1"))
+# Теневой скоринг пропускается, пока принятых запросов к скорингу больше этого числа
+SHADOW_MAX_ACTIVE_REQUESTS = int(os.getenv("SHADOW_MAX_ACTIVE_REQUESTS", "1"))
+
+# Обработка повторяющихся CustomerId по умолчанию (см. deduplicate_clients);
+# в запросе переопределяется параметром duplicates
+DEDUP_POLICIES = ("reject", "keep_last", "fanout")
+DEDUP_POLICY = os.getenv("DEDUP_POLICY", "fanout")
+
+# Входные признаки, которые добавляются к результатам в выгрузке с признаками
+EXPORT_FEATURES = ['CreditScore', 'Age', 'Tenure', 'Balance', 'NumOfProducts', 'HasCrCard',
+                   'IsActiveMember', 'EstimatedSalary', 'Gender', 'Gender_Male']
+# Строк в одной части потоковой выгрузки результатов
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "100000"))
+
+# Число строк прогревочного пакета на страну (0 — без прогрева)
+STARTUP_WARMUP_ROWS = int(os.getenv("STARTUP_WARMUP_ROWS", "256"))
+# sequential — прежний старт для сравнения в bench_cold_start: модели загружаются по очереди
+# до приёма запросов и без прогрева; по умолчанию — параллельно в фоне с прогревом
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background")
+
+# Соответствие значения Geography и бандла модели; заполняется при старте (load_models)
+model_bundles = {}
+# Бандлы компактных моделей по странам; заполняется при старте (load_fast_models)
+fast_bundles = {}
+# Бандлы моделей-претендентов по странам; заполняется при старте (load_challengers)
+challenger_bundles = {}
+# Результаты скоринга для постраничного просмотра (/results/{result_id})
+result_store = ResultStore()
+shadow_scorer = ShadowScorer(SHADOW_WORKERS, SHADOW_QUEUE,
+                             is_busy=lambda: admission.active_requests > SHADOW_MAX_ACTIVE_REQUESTS)
+
+# Состояние старта: готовность, ошибка загрузки и разбивка времени по этапам (секунды)
+models_ready = threading.Event()
+startup_error = None
+startup_timings = {}
 
-# Загрузка моделей для каждой страны (предполагается, что модели загружены так же)
-try:
-    model_france_bundle = joblib.load("models/model_france.pkl")
-    model_spain_bundle = joblib.load("models/model_spain.pkl")
-    model_germany_bundle = joblib.load("models/model_germany.pkl")
-except Exception as e:
-    raise RuntimeError(f"Ошибка загрузки моделей: {e}")
+# Признаки, на которых обучены модели (порядок важен)
+MODEL_FEATURES = ['CreditScore', 'Age', 'Tenure', 'Balance', 'NumOfProducts',
+                  'HasCrCard', 'IsActiveMember', 'EstimatedSalary', 'Gender_Male']
 
-model_france = model_france_bundle["model"]
-threshold_france = model_france_bundle["threshold"]
+# Максимальное число строк расширенной матрицы сценариев, обрабатываемое за один проход модели
+SCENARIO_CHUNK_ROWS = 200_000
 
-model_spain = model_spain_bundle["model"]
-threshold_spain = model_spain_bundle["threshold"]
+# Столбцы, по которым допускается группировка при выборе топ-K клиентов
+TOP_K_GROUP_COLUMNS = ['Geography', 'Gender', 'NumOfProducts', 'HasCrCard', 'IsActiveMember']
 
-model_germany = model_germany_bundle["model"]
-threshold_germany = model_germany_bundle["threshold"]
+
+def load_models(parallel: bool = True) -> dict:
+    """Параллельная (при parallel=False — последовательная) загрузка бандлов моделей
+    всех стран в model_bundles.
+
+    Возвращает время загрузки каждой модели в секундах.
+    """
+    def load(country):
+        start = time.perf_counter()
+        bundle = joblib.load(MODEL_PATHS[country])
+        return country, bundle, time.perf_counter() - start
+
+    try:
+        if parallel:
+            with ThreadPoolExecutor(max_workers=len(MODEL_PATHS)) as pool:
+                loaded = list(pool.map(load, MODEL_PATHS))
+        else:
+            loaded = [load(country) for country in MODEL_PATHS]
+    except Exception as e:
+        raise RuntimeError(f"Ошибка загрузки моделей: {e}")
+
+    timings = {}
+    for country, bundle, seconds in loaded:
+        model_bundles[country] = bundle
+        timings[country] = seconds
+    return timings
+
+
+def load_challengers() -> list:
+    """Загрузка моделей-претендентов, которые есть в CHALLENGER_DIR; возвращает список стран."""
+    for country in MODEL_PATHS:
+        path = os.path.join(CHALLENGER_DIR, f"challenger_{country.lower()}.pkl")
+        if os.path.exists(path):
+            bundle = joblib.load(path)
+            # Теневой скоринг не должен отбирать ядра у основной модели
+            bundle["model"].get_booster().set_param({"nthread": SHADOW_NTHREAD})
+            challenger_bundles[country] = bundle
+    return list(challenger_bundles)
+
+
+def load_fast_models() -> list:
+    """Загрузка компактных моделей, прошедших проверку точности; возвращает список стран."""
+    for country, path in MODEL_PATHS.items():
+        fast_path = path.replace(".pkl", "_fast.pkl")
+        if not os.path.exists(fast_path):
+            continue
+        bundle = joblib.load(fast_path)
+        if bundle["auc_loss"] > MAX_AUC_LOSS:
+            logger.warning(f"Компактная модель {country} не загружена: потеря ROC-AUC "
+                           f"{bundle['auc_loss']} больше {MAX_AUC_LOSS}")
+            continue
+        fast_bundles[country] = bundle
+    return list(fast_bundles)
+
+
+def warmup_batch(country: str, rows: int) -> pd.DataFrame:
+    """Синтетический пакет клиентов одной страны для прогрева."""
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "CustomerId": np.arange(rows),
+        "Geography": country,
+        "CreditScore": rng.integers(350, 851, rows).astype(float),
+        "Age": rng.integers(18, 93, rows).astype(float),
+        "Tenure": rng.integers(0, 11, rows).astype(float),
+        "Balance": rng.uniform(0, 250000, rows),
+        "NumOfProducts": rng.integers(1, 5, rows).astype(float),
+        "HasCrCard": rng.integers(0, 2, rows),
+        "IsActiveMember": rng.integers(0, 2, rows),
+        "EstimatedSalary": rng.uniform(0, 200000, rows),
+        "Gender": rng.choice(["Male", "Female"], rows),
+    })
+
+
+def prepare_models(sequential: bool = False):
+    """Старт сервиса: загрузка моделей, прогрев и переключение готовности.
+
+    sequential=True — прежний порядок: модели по очереди и без прогрева.
+    """
+    global startup_error
+    started = time.perf_counter()
+    startup_timings["import_to_startup"] = started - IMPORT_STARTED
+    try:
+        for country, seconds in load_models(parallel=not sequential).items():
+            startup_timings[f"load_{country}"] = seconds
+        startup_timings["load_models"] = time.perf_counter() - started
+        fast_models = load_fast_models()
+        logger.info(f"Компактные модели (tier=fast): {', '.join(fast_models) or 'нет'}")
+        challengers = load_challengers()
+        if challengers:
+            logger.info(f"Теневой скоринг включён для: {', '.join(challengers)}")
+
+        # Прогрев проходит весь путь /predict_batch: валидацию pydantic, DataFrame,
+        # groupby, predict_proba и JSON-сериализацию ответа
+        if STARTUP_WARMUP_ROWS > 0 and not sequential:
+            warmup_started = time.perf_counter()
+            for country in MODEL_PATHS:
+                country_started = time.perf_counter()
+                records = warmup_batch(country, STARTUP_WARMUP_ROWS).to_dict(orient="records")
+                predict_batch(ClientsData(clients=records), BackgroundTasks(), None, None)
+                startup_timings[f"warmup_{country}"] = time.perf_counter() - country_started
+            startup_timings["warmup"] = time.perf_counter() - warmup_started
+    except Exception as e:
+        startup_error = str(e)
+        logger.error(f"Ошибка старта: {e}")
+        return
+
+    startup_timings["total"] = time.perf_counter() - IMPORT_STARTED
+    models_ready.set()
+    logger.info("Модели готовы: " + ", ".join(f"{k}={v:.3f}s" for k, v in startup_timings.items()))
 
 
 def validate_and_preprocess_input(df: pd.DataFrame) -> pd.DataFrame:
@@ -30,17 +247,54 @@ def validate_and_preprocess_input(df: pd.DataFrame) -> pd.DataFrame:
     elif 'Gender_Male' in df.columns:
         df['Gender_Male'] = pd.to_numeric(df['Gender_Male'], errors='coerce').fillna(0).astype(int)
 
-    model_features = ['CreditScore', 'Age', 'Tenure', 'Balance', 'NumOfProducts',
-                      'HasCrCard', 'IsActiveMember', 'EstimatedSalary', 'Gender_Male']
-
-    missing_features = [col for col in model_features if col not in df.columns]
+    missing_features = [col for col in MODEL_FEATURES if col not in df.columns]
     if missing_features:
         raise ValueError(f"Отсутствуют обязательные признаки: {missing_features}")
 
-    X = df[model_features].copy()
+    X = df[MODEL_FEATURES].copy()
     return X
 
 
+def deduplicate_clients(df: pd.DataFrame, policy: str):
+    """Этап обработки повторяющихся CustomerId.
+
+    Возвращает (df для скоринга, метки представителей или None). Политики:
+    - reject — ValueError, если CustomerId повторяется;
+    - keep_last — для каждого CustomerId остаётся последняя строка;
+    - fanout — одинаковые строки скорятся один раз, результат размножается на все
+      копии (fan_out_results); строки с одним CustomerId, но разными признаками
+      скорятся по отдельности. Вторым элементом возвращаются метки индекса строки-
+      представителя для каждой входной строки.
+    """
+    if policy not in DEDUP_POLICIES:
+        raise ValueError(f"Неизвестная политика для повторов CustomerId: {policy}")
+    if df["CustomerId"].is_unique:
+        return df, None
+
+    if policy == "reject":
+        duplicated = df.loc[df["CustomerId"].duplicated(), "CustomerId"].unique()
+        raise ValueError(f"Повторяющиеся CustomerId ({len(duplicated)}): {duplicated[:10].tolist()}")
+    if policy == "keep_last":
+        return df[~df["CustomerId"].duplicated(keep="last")], None
+
+    # Коды factorize идут в порядке первого появления, поэтому code — номер строки в unique
+    codes, uniques = pd.factorize(pd.util.hash_pandas_object(df, index=False).to_numpy())
+    unique = df[~pd.Series(codes).duplicated().to_numpy()]
+    return unique, unique.index[codes]
+
+
+def fan_out_results(results: pd.DataFrame, index: pd.Index, representatives: pd.Index) -> pd.DataFrame:
+    """Результаты для всех входных строк по результатам строк-представителей.
+
+    Порядок строк как у results, копии следуют за своим представителем; индекс — исходный.
+    """
+    rank = results.index.get_indexer(representatives)
+    order = np.argsort(rank, kind="stable")
+    expanded = results.take(rank[order])
+    expanded.index = index[order]
+    return expanded
+
+
 class ClientData(BaseModel):
     CustomerId: int
     Geography: str
@@ -61,62 +315,505 @@ class ClientsData(BaseModel):
     clients: List[ClientData]
 
 
-@app.post("/predict_batch")
-def predict_batch(data: ClientsData):
-    # Преобразуем входные данные в DataFrame
-    df = pd.DataFrame([client.dict() for client in data.clients])
+# Сценарий изменения признаков: set — присвоить значение, add — прибавить к текущему
+class Scenario(BaseModel):
+    name: str
+    set: Dict[str, float] = {}
+    add: Dict[str, float] = {}
+
+
+class ScenariosData(BaseModel):
+    clients: List[ClientData]
+    scenarios: List[Scenario]
+
+
+def score_clients(df: pd.DataFrame, deadline: float = None, shadow_jobs: list = None,
+                  tier: str = "full") -> pd.DataFrame:
+    """Скоринг клиентов моделью своей страны.
+
+    Возвращает DataFrame с CustomerId, Geography, prediction и churn_probability,
+    индекс которого совпадает с индексом входного df. После deadline
+    (по time.monotonic) скоринг прерывается исключением DeadlineExceeded.
+    Если передан список shadow_jobs, в него добавляются задания теневого скоринга
+    для стран с моделью-претендентом (аргументы ShadowScorer.submit).
+    При tier="fast" используются компактные модели; для страны без компактной
+    модели — полная. Теневой скоринг сравнивает претендента только с полной моделью.
+    """
+    # groupby отбрасывает строки без Geography, поэтому они отклоняются заранее
+    missing_geography = int(df['Geography'].isna().sum())
+    if missing_geography:
+        raise ValueError(f"Не указан Geography у {missing_geography} строк")
 
     # Группируем по Geography, чтобы для каждой группы использовать нужную модель
+    with stage("groupby"):
+        groups = df.groupby('Geography').indices
+
     results = []
-    for geography, group in df.groupby('Geography'):
-        try:
+    for geography, positions in groups.items():
+        check_deadline(deadline)
+        group = df.take(positions)
+        with stage("validation"):
             X = validate_and_preprocess_input(group)
-        except ValueError as e:
-            raise HTTPException(status_code=400, detail=str(e))
 
-        if geography == "France":
-            pipeline = model_france
-            threshold = threshold_france
-        elif geography == "Spain":
-            pipeline = model_spain
-            threshold = threshold_spain
-        elif geography == "Germany":
-            pipeline = model_germany
-            threshold = threshold_germany
-        else:
-            raise HTTPException(status_code=400, detail=f"Неподдерживаемый Geography: {geography}")
+        if geography not in model_bundles:
+            raise ValueError(f"Неподдерживаемый Geography: {geography}")
+        fast = tier == "fast" and geography in fast_bundles
+        bundle = fast_bundles[geography] if fast else model_bundles[geography]
+        pipeline = bundle["model"]
+        threshold = bundle["threshold"]
 
-        try:
+        with stage(f"predict_proba[{geography}]"):
+            predict_started = time.perf_counter()
             probs = pipeline.predict_proba(X)[:, 1]
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Ошибка предсказания: {e}")
+            predict_seconds = time.perf_counter() - predict_started
+
+        if shadow_jobs is not None and not fast and geography in challenger_bundles:
+            shadow_jobs.append((geography, challenger_bundles[geography], X, probs, threshold, predict_seconds))
 
         preds = (probs >= threshold).astype(int)
         group_result = pd.DataFrame({
             "CustomerId": group["CustomerId"],
             "Geography": geography,
             "prediction": preds,
-            "churn_probability": [round(prob, 4) for prob in probs]
+            "churn_probability": probs.astype(np.float64).round(4)
         })
         results.append(group_result)
 
-    if results:
-        final_results = pd.concat(results, ignore_index=True)
-        return final_results.to_dict(orient="records")
+    if not results:
+        raise ValueError("Нет данных для предсказания")
+    return pd.concat(results)
+
+
+def select_top_k(df: pd.DataFrame, k: int, group_by: Optional[List[str]] = None,
+                 score_col: str = "churn_probability") -> pd.DataFrame:
+    """Топ-K строк по score_col (по убыванию) в каждой группе group_by.
+
+    Вместо полной сортировки используется частичный выбор (np.argpartition):
+    O(n) на группировку и отбор плюс O(k log k) на упорядочивание каждой группы.
+    """
+    scores = df[score_col].to_numpy()
+    if group_by:
+        groups = df.groupby(group_by, sort=True, observed=True).indices.values()
     else:
+        groups = [np.arange(len(df))]
+
+    picked = []
+    for idx in groups:
+        if len(idx) > k:
+            idx = idx[np.argpartition(-scores[idx], k - 1)[:k]]
+        picked.append(idx[np.argsort(-scores[idx], kind="stable")])
+
+    if not picked:
+        return df.iloc[:0]
+    return df.iloc[np.concatenate(picked)]
+
+
+def score_scenarios(df: pd.DataFrame, scenarios: List[Scenario],
+                    chunk_rows: int = SCENARIO_CHUNK_ROWS, deadline: float = None) -> pd.DataFrame:
+    """Вероятность оттока каждого клиента в базовом случае и в каждом сценарии.
+
+    Матрица N клиентов x M сценариев строится через broadcasting (без циклов по строкам)
+    и скорится одним predict_proba на блок; размер блока ограничен chunk_rows строками.
+    Возвращает длинный DataFrame: CustomerId, Geography, scenario, baseline_probability,
+    churn_probability, delta, baseline_prediction, prediction.
+    """
+    for scenario in scenarios:
+        unknown = [col for col in {**scenario.set, **scenario.add} if col not in MODEL_FEATURES]
+        if unknown:
+            raise ValueError(f"Сценарий '{scenario.name}': неизвестные признаки {unknown}")
+
+    # Маска и значения присваиваний, добавки; строка 0 — базовый случай без изменений
+    n_variants = len(scenarios) + 1
+    set_mask = np.zeros((n_variants, len(MODEL_FEATURES)), dtype=bool)
+    set_values = np.zeros((n_variants, len(MODEL_FEATURES)))
+    add_values = np.zeros((n_variants, len(MODEL_FEATURES)))
+    for i, scenario in enumerate(scenarios, start=1):
+        for col, value in scenario.set.items():
+            set_mask[i, MODEL_FEATURES.index(col)] = True
+            set_values[i, MODEL_FEATURES.index(col)] = value
+        for col, value in scenario.add.items():
+            add_values[i, MODEL_FEATURES.index(col)] = value
+
+    clients_per_chunk = max(1, chunk_rows // n_variants)
+    names = np.array([scenario.name for scenario in scenarios], dtype=object)
+    results = []
+    for geography, group in df.groupby('Geography'):
+        X = validate_and_preprocess_input(group)
+
+        if geography not in model_bundles:
+            raise ValueError(f"Неподдерживаемый Geography: {geography}")
+        pipeline = model_bundles[geography]["model"]
+        threshold = model_bundles[geography]["threshold"]
+
+        values = X.to_numpy(dtype=np.float64)
+        probs = np.empty((len(values), n_variants))
+        for start in range(0, len(values), clients_per_chunk):
+            check_deadline(deadline)
+            block = values[start:start + clients_per_chunk]
+            # (варианты, клиенты, признаки)
+            expanded = np.where(set_mask[:, None, :], set_values[:, None, :], block[None, :, :])
+            expanded += add_values[:, None, :]
+            chunk_probs = pipeline.predict_proba(
+                pd.DataFrame(expanded.reshape(-1, len(MODEL_FEATURES)), columns=MODEL_FEATURES)
+            )[:, 1]
+            probs[start:start + len(block)] = chunk_probs.reshape(n_variants, len(block)).T
+
+        baseline = probs[:, :1]
+        scenario_probs = probs[:, 1:]
+        results.append(pd.DataFrame({
+            "CustomerId": np.repeat(group["CustomerId"].to_numpy(), len(scenarios)),
+            "Geography": geography,
+            "scenario": np.tile(names, len(group)),
+            "baseline_probability": np.repeat(baseline[:, 0], len(scenarios)).round(4),
+            "churn_probability": scenario_probs.ravel().round(4),
+            "delta": (scenario_probs - baseline).ravel().round(4),
+            "baseline_prediction": np.repeat(baseline[:, 0] >= threshold, len(scenarios)).astype(int),
+            "prediction": (scenario_probs >= threshold).ravel().astype(int),
+        }))
+
+    if not results:
+        raise ValueError("Нет данных для предсказания")
+    return pd.concat(results, ignore_index=True)
+
+
+def summarize_scenarios(scenario_results: pd.DataFrame) -> pd.DataFrame:
+    """Агрегированный эффект (uplift) каждого сценария."""
+    summary = scenario_results.groupby("scenario", sort=False).agg(
+        clients=("CustomerId", "size"),
+        baseline_probability=("baseline_probability", "mean"),
+        churn_probability=("churn_probability", "mean"),
+        mean_delta=("delta", "mean"),
+        baseline_churners=("baseline_prediction", "sum"),
+        churners=("prediction", "sum"),
+    )
+    summary["churners_change"] = summary["churners"] - summary["baseline_churners"]
+    return summary.round(4).reset_index()
+
+
+def request_deadline(timeout: Optional[float]) -> float:
+    """Срок выполнения запроса: заголовок X-Request-Timeout (секунды) или значение по умолчанию."""
+    return time.monotonic() + (timeout if timeout else REQUEST_TIMEOUT_SECONDS)
+
+
+def score_with_admission(df: pd.DataFrame, deadline: float, shadow_jobs: list = None,
+                         tier: str = "full") -> pd.DataFrame:
+    """Скоринг с учётом ограничений нагрузки; большие пакеты при AUTO_SHARD скорятся частями."""
+    if tier not in MODEL_TIERS:
+        raise ValueError(f"Неизвестный уровень модели: {tier}")
+    if not AUTO_SHARD or len(df) <= MAX_BATCH_ROWS:
+        with admission.admit(len(df), deadline):
+            return score_clients(df, deadline, shadow_jobs, tier)
+
+    results = []
+    for start in range(0, len(df), MAX_BATCH_ROWS):
+        shard = df.iloc[start:start + MAX_BATCH_ROWS]
+        with admission.admit(len(shard), deadline):
+            results.append(score_clients(shard, deadline, shadow_jobs, tier))
+    return pd.concat(results)
+
+
+@app.middleware("http")
+async def limit_scoring_load(request: Request, call_next):
+    # Ограничения проверяются до чтения и разбора тела запроса
+    if request.method != "POST" or not request.url.path.startswith("/predict"):
+        return await call_next(request)
+    if not models_ready.is_set():
+        return JSONResponse(status_code=503, content={"detail": "Модели ещё не готовы"},
+                            headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+    # Сжатое тело распаковывается позже, поэтому для него действует отдельный лимит;
+    # тело без Content-Length ограничивает CompressionMiddleware при чтении
+    max_body_mb = MAX_COMPRESSED_BODY_MB if request.headers.get("content-encoding") else MAX_BODY_MB
+    content_length = request.headers.get("content-length")
+    if content_length and int(content_length) > max_body_mb * 1024 * 1024:
+        return JSONResponse(status_code=413, content={"detail": f"Тело запроса больше {max_body_mb} МБ"})
+    try:
+        with admission.request_slot():
+            return await call_next(request)
+    except AdmissionRejected as exc:
+        return admission_rejected_handler(request, exc)
+
+
+@app.exception_handler(AdmissionRejected)
+def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    headers = {"Retry-After": str(exc.retry_after)} if exc.retry_after is not None else None
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=headers)
+
+
+@app.exception_handler(DeadlineExceeded)
+def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
+@app.post("/predict_batch")
+def predict_batch(data: ClientsData, background_tasks: BackgroundTasks,
+                  x_request_timeout: Optional[float] = Header(None),
+                  x_profile: Optional[str] = Header(None),
+                  store: bool = False,
+                  duplicates: Optional[str] = None,
+                  tier: str = "full"):
+    """Скоринг пакета клиентов; при store=true результаты сохраняются для
+    постраничного просмотра, идентификатор — в заголовке X-Result-Id.
+    duplicates — политика для повторяющихся CustomerId (по умолчанию DEDUP_POLICY),
+    tier — уровень модели: full (полная) или fast (компактная)."""
+    deadline = request_deadline(x_request_timeout)
+    if not data.clients:
+        raise HTTPException(status_code=400, detail="Нет данных для предсказания")
+    headers = {}
+
+    with profiling.profile_request("predict_batch", profiling.profile_mode(x_profile)) as profiler:
+        if profiler is not None:
+            profiler.meta["rows"] = len(data.clients)
+            headers["X-Profile-Id"] = profiler.id
+
+        # Преобразуем входные данные в DataFrame
+        with stage("dataframe"):
+            df = pd.DataFrame([client.dict() for client in data.clients])
+
+        shadow_jobs = []
+        try:
+            with stage("dedup"):
+                unique, representatives = deduplicate_clients(df, duplicates or DEDUP_POLICY)
+            final_results = score_with_admission(unique, deadline, shadow_jobs, tier)
+            if representatives is not None:
+                with stage("fan_out"):
+                    final_results = fan_out_results(final_results, df.index, representatives)
+        except (AdmissionRejected, DeadlineExceeded):
+            raise
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Ошибка предсказания: {e}")
+
+        # Теневой скоринг ставится в очередь только после отправки ответа
+        if shadow_jobs:
+            background_tasks.add_task(shadow_scorer.submit_all, shadow_jobs)
+
+        if store:
+            with stage("result_index"):
+                # Входные признаки сохраняются вместе с результатами для выгрузки с признаками
+                features = df.loc[final_results.index, EXPORT_FEATURES].dropna(axis=1, how="all")
+                headers["X-Result-Id"] = result_store.add(final_results, features)
+
+        # JSON кодируется здесь, а не в FastAPI после возврата, чтобы попасть в профиль
+        with stage("serialization"):
+            return Response(final_results.to_json(orient="records"), media_type="application/json",
+                            headers=headers)
+
+
+@app.post("/predict_top_k")
+def predict_top_k(data: ClientsData,
+                  k: int = Query(10, ge=1),
+                  group_by: Optional[List[str]] = Query(None),
+                  only_churn: bool = True,
+                  duplicates: Optional[str] = None,
+                  tier: str = "full",
+                  x_request_timeout: Optional[float] = Header(None)):
+    """Топ-K клиентов с наибольшей вероятностью оттока (в целом или по группам)."""
+    deadline = request_deadline(x_request_timeout)
+    if not data.clients:
+        raise HTTPException(status_code=400, detail="Нет данных для предсказания")
+    group_by = group_by or []
+    unsupported = [col for col in group_by if col not in TOP_K_GROUP_COLUMNS]
+    if unsupported:
+        raise HTTPException(status_code=400, detail=f"Неподдерживаемая группировка: {unsupported}")
+
+    df = pd.DataFrame([client.dict() for client in data.clients])
+
+    try:
+        unique, representatives = deduplicate_clients(df, duplicates or DEDUP_POLICY)
+        results = score_with_admission(unique, deadline, tier=tier)
+        if representatives is not None:
+            results = fan_out_results(results, df.index, representatives)
+    except (AdmissionRejected, DeadlineExceeded):
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка предсказания: {e}")
+
+    for col in group_by:
+        if col not in results.columns:
+            results[col] = df[col]
+    if only_churn:
+        results = results[results["prediction"] == 1]
+
+    return select_top_k(results, k, group_by).to_dict(orient="records")
+
+
+@app.post("/predict_scenarios")
+def predict_scenarios(data: ScenariosData, x_request_timeout: Optional[float] = Header(None)):
+    """Изменение вероятности оттока клиентов при заданных сценариях."""
+    deadline = request_deadline(x_request_timeout)
+    if not data.scenarios:
+        raise HTTPException(status_code=400, detail="Не заданы сценарии")
+    if not data.clients:
         raise HTTPException(status_code=400, detail="Нет данных для предсказания")
 
+    df = pd.DataFrame([client.dict() for client in data.clients])
+
+    try:
+        with admission.admit(len(df), deadline):
+            scenario_results = score_scenarios(df, data.scenarios, deadline=deadline)
+    except (AdmissionRejected, DeadlineExceeded):
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка предсказания: {e}")
+
+    return {
+        "clients": scenario_results.to_dict(orient="records"),
+        "scenarios": summarize_scenarios(scenario_results).to_dict(orient="records"),
+    }
+
+
+@app.get("/health/live")
+def health_live():
+    """Liveness: процесс жив и обслуживает запросы (в том числе во время загрузки моделей)."""
+    if startup_error:
+        return JSONResponse(status_code=500, content={"status": "error", "detail": startup_error})
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+def health_ready():
+    """Readiness: модели загружены и прогреты, скоринг отвечает с рабочей скоростью."""
+    if not models_ready.is_set():
+        return JSONResponse(status_code=503, content={"status": "starting", "detail": startup_error})
+    return {"status": "ready"}
+
+
+@app.get("/health/startup")
+def health_startup():
+    """Разбивка времени старта по этапам, в секундах."""
+    return {"ready": models_ready.is_set(), "timings": {k: round(v, 4) for k, v in startup_timings.items()}}
+
+
+def check_admin_token(token: Optional[str]):
+    if ADMIN_TOKEN and token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Неверный токен администратора")
+
+
+@app.get("/admin/profiles")
+def admin_list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """Последние сохранённые профили запросов (без стеков)."""
+    check_admin_token(x_admin_token)
+    return profiling.list_profiles()
+
+
+@app.get("/admin/profiles/{profile_id}")
+def admin_get_profile(profile_id: str, format: str = "json", x_admin_token: Optional[str] = Header(None)):
+    """Профиль запроса; format=folded — свёрнутые стеки для flamegraph.pl/speedscope."""
+    check_admin_token(x_admin_token)
+    try:
+        profile = profiling.load_profile(profile_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    if format == "folded":
+        return PlainTextResponse(profiling.folded_text(profile))
+    return profile
+
+
+@app.get("/results/{result_id}")
+def get_results_page(result_id: str,
+                     page: int = Query(1, ge=1),
+                     page_size: int = Query(50, ge=1, le=1000),
+                     sort_by: str = "churn_probability",
+                     descending: bool = True,
+                     country: Optional[str] = None,
+                     prediction: Optional[int] = Query(None, ge=0, le=1),
+                     min_probability: Optional[float] = Query(None, ge=0, le=1),
+                     max_probability: Optional[float] = Query(None, ge=0, le=1)):
+    """Страница сохранённых результатов скоринга с сортировкой и фильтрами."""
+    try:
+        run = result_store.get(result_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Результаты не найдены или устарели")
+    try:
+        total, rows = run.page((page - 1) * page_size, page_size, sort_by, descending,
+                               country, prediction, min_probability, max_probability)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"total": total, "page": page, "page_size": page_size, "rows": rows.to_dict(orient="records")}
+
+
+@app.get("/results/{result_id}/top_k")
+def get_results_top_k(result_id: str,
+                      k: int = Query(10, ge=1, le=1000),
+                      group_by: Optional[List[str]] = Query(None),
+                      only_churn: bool = True):
+    """Топ-K клиентов сохранённого прогона с наибольшей вероятностью оттока (в целом или по группам)."""
+    group_by = group_by or []
+    unsupported = [col for col in group_by if col not in TOP_K_GROUP_COLUMNS]
+    if unsupported:
+        raise HTTPException(status_code=400, detail=f"Неподдерживаемая группировка: {unsupported}")
+    try:
+        run = result_store.get(result_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Результаты не найдены или устарели")
+    try:
+        return run.top_k(k, group_by, only_churn).to_dict(orient="records")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/results/{result_id}/export")
+def export_results(result_id: str, format: str = "csv", include_features: bool = False):
+    """Потоковая выгрузка сохранённых результатов в CSV или Parquet (по частям)."""
+    try:
+        run = result_store.get(result_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Результаты не найдены или устарели")
+    if format not in ("csv", "parquet"):
+        raise HTTPException(status_code=400, detail="Формат выгрузки: csv или parquet")
+
+    frames = run.frames(EXPORT_CHUNK_ROWS, include_features)
+    chunks, media_type = ((csv_chunks(frames), "text/csv") if format == "csv"
+                          else (parquet_chunks(frames), "application/vnd.apache.parquet"))
+    filename = f"churn_predictions{'_with_features' if include_features else ''}.{format}"
+    return StreamingResponse(chunks, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@app.delete("/results/{result_id}")
+def delete_results(result_id: str):
+    try:
+        result_store.delete(result_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Результаты не найдены или устарели")
+    return {"deleted": result_id}
+
+
+@app.get("/admin/shadow")
+def admin_shadow_report(x_admin_token: Optional[str] = Header(None)):
+    """Сравнение основных моделей с претендентами по странам."""
+    check_admin_token(x_admin_token)
+    return {"challengers": list(challenger_bundles), "countries": shadow_scorer.report()}
+
+
+@app.get("/model_tiers")
+def get_model_tiers():
+    """Доступные уровни моделей по странам и метрики компактных моделей."""
+    if not models_ready.is_set():
+        raise HTTPException(status_code=503, detail="Модели ещё не готовы")
+    keys = ("n_trees", "max_depth", "auc_full", "auc_distilled", "auc_loss", "agreement")
+    return {
+        country: {
+            "tiers": ["full", "fast"] if country in fast_bundles else ["full"],
+            "fast": {key: fast_bundles[country][key] for key in keys} if country in fast_bundles else None,
+        }
+        for country in model_bundles
+    }
+
 
 @app.get("/feature_importances")
 def get_feature_importances(country: str = "France"):
-    if country == "France":
-        model_bundle = model_france_bundle
-    elif country == "Spain":
-        model_bundle = model_spain_bundle
-    elif country == "Germany":
-        model_bundle = model_germany_bundle
-    else:
+    if not models_ready.is_set():
+        raise HTTPException(status_code=503, detail="Модели ещё не готовы")
+    if country not in model_bundles:
         raise HTTPException(status_code=400, detail="Неподдерживаемая страна")
+    model_bundle = model_bundles[country]
 
     model = model_bundle["model"]
     if hasattr(model, "feature_importances_"):
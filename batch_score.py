@@ -0,0 +1,304 @@
+"""Офлайн-скоринг больших файлов с клиентами без HTTP.
+
+Файл читается по частям (chunk), части скорятся в пуле процессов теми же моделями
+и правилами предобработки, что и /predict_batch, и записываются в выходной файл
+в исходном порядке. В памяти одновременно находится не больше 2 * workers частей,
+поэтому размер файла не ограничен объёмом RAM.
+
+В дельта-режиме (--state) хранится отпечаток признаков каждого CustomerId и версия
+моделей с прошлого запуска: заново скорятся только новые и изменившиеся клиенты,
+остальные результаты берутся из прошлого запуска.
+
+Запуск из корня проекта:
+    python batch_score.py portfolio.csv predictions.parquet --chunksize 200000 --workers 4
+    python batch_score.py portfolio.csv predictions.parquet --state scoring_state.parquet
+"""
+import argparse
+import hashlib
+import os
+import resource
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import backend
+
+# Столбцы входного файла, которые нужны для скоринга
+INPUT_COLUMNS = ['CustomerId', 'Geography', 'Gender'] + backend.MODEL_FEATURES
+
+
+def file_format(path: str) -> str:
+    if path.lower().endswith(".parquet"):
+        return "parquet"
+    if path.lower().endswith(".csv"):
+        return "csv"
+    raise ValueError(f"Неподдерживаемый формат файла: {path} (ожидается .csv или .parquet)")
+
+
+def read_chunks(path: str, chunksize: int):
+    """Итератор по частям входного файла (только нужные для скоринга столбцы)."""
+    if file_format(path) == "parquet":
+        parquet_file = pq.ParquetFile(path)
+        columns = [col for col in INPUT_COLUMNS if col in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        header = pd.read_csv(path, nrows=0).columns
+        columns = [col for col in INPUT_COLUMNS if col in header]
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+
+class ResultWriter:
+    """Последовательная запись результатов в CSV или Parquet."""
+
+    def __init__(self, path: str, metadata: dict = None):
+        self.path = path
+        self.format = file_format(path)
+        self.metadata = metadata
+        self.parquet_writer = None
+        self.rows = 0
+
+    def write(self, chunk: pd.DataFrame):
+        if self.format == "parquet":
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self.metadata:
+                table = table.replace_schema_metadata({**table.schema.metadata, **self.metadata})
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self.parquet_writer.write_table(table)
+        else:
+            chunk.to_csv(self.path, mode="w" if self.rows == 0 else "a", header=self.rows == 0, index=False)
+        self.rows += len(chunk)
+
+    def add_metadata(self, metadata: dict):
+        """Метаданные Parquet-файла, известные только к концу записи."""
+        if self.parquet_writer is not None:
+            self.parquet_writer.add_key_value_metadata(metadata)
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+
+
+def init_worker():
+    # При запуске воркеров через spawn модели в дочернем процессе ещё не загружены
+    if not backend.model_bundles:
+        backend.load_models()
+    # Параллелизм даёт пул процессов, поэтому каждая модель работает в один поток
+    for bundle in backend.model_bundles.values():
+        bundle["model"].get_booster().set_param({"nthread": 1})
+
+
+def score_chunk(chunk: pd.DataFrame):
+    """Скоринг части; возвращает результат и время скоринга в секундах."""
+    start = time.perf_counter()
+    result = backend.score_clients(chunk)
+    return result, time.perf_counter() - start
+
+
+def models_version() -> str:
+    """Версия моделей — хэш содержимого файлов полных моделей (backend.MODEL_PATHS)."""
+    digest = hashlib.md5()
+    for path in sorted(backend.MODEL_PATHS.values()):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def feature_fingerprints(chunk: pd.DataFrame) -> np.ndarray:
+    """Векторизованный 64-битный хэш страны и признаков модели для каждой строки."""
+    X = backend.validate_and_preprocess_input(chunk).astype("float64")
+    X.insert(0, "Geography", chunk["Geography"].astype(str))
+    return pd.util.hash_pandas_object(X, index=False).to_numpy()
+
+
+class ScoringState:
+    """Отпечатки признаков прошлого запуска, индексированные по CustomerId.
+
+    В памяти хранятся только отсортированные CustomerId, отпечатки и номера строк
+    в файле состояния (около 25 байт на клиента); готовые результаты читаются из файла
+    по группам строк (row group) только для тех клиентов, которые пропускаются.
+    """
+
+    def __init__(self, path: str, version: str):
+        self.version = version
+        self.file = pq.ParquetFile(path)
+        metadata = self.file.metadata.metadata or {}
+        self.same_version = metadata.get(b"model_version", b"").decode() == version
+        # Скорость последнего полного пересчёта (строк/с) — база для оценки сэкономленного времени
+        self.full_rows_per_sec = float(metadata.get(b"full_rows_per_sec", b"0")) or None
+        self.result_columns = [name for name in self.file.schema_arrow.names if name != "fingerprint"]
+
+        rows = self.file.metadata.num_rows
+        ids = np.empty(rows, dtype=np.int64)
+        fingerprints = np.empty(rows, dtype=np.uint64)
+        start = 0
+        for batch in self.file.iter_batches(columns=["CustomerId", "fingerprint"]):
+            ids[start:start + len(batch)] = batch.column("CustomerId").to_numpy()
+            fingerprints[start:start + len(batch)] = batch.column("fingerprint").to_numpy()
+            start += len(batch)
+
+        # Устойчивая сортировка: среди повторов CustomerId последней идёт последняя строка файла
+        order = np.argsort(ids, kind="stable")
+        ids = ids[order]
+        last = np.append(ids[1:] != ids[:-1], True)
+        self.ids = ids[last]
+        self.rows = order[last]
+        self.fingerprints = fingerprints[self.rows]
+        self.seen = np.zeros(len(self.ids), dtype=bool)
+
+        group_rows = [self.file.metadata.row_group(i).num_rows for i in range(self.file.num_row_groups)]
+        self.group_starts = np.cumsum([0] + group_rows[:-1])
+        self._groups = {}
+
+    def _read_group(self, group: int) -> pa.Table:
+        # Соседние части входного файла обычно попадают в одни и те же группы строк
+        if group not in self._groups:
+            if len(self._groups) >= 2:
+                self._groups.pop(next(iter(self._groups)))
+            self._groups[group] = self.file.read_row_group(group, columns=self.result_columns)
+        return self._groups[group]
+
+    def results_at(self, rows: np.ndarray) -> pd.DataFrame:
+        """Результаты прошлого запуска для строк rows файла состояния (в том же порядке)."""
+        groups = np.searchsorted(self.group_starts, rows, side="right") - 1
+        order = np.argsort(groups, kind="stable")
+        rows, groups = rows[order], groups[order]
+        bounds = np.flatnonzero(np.diff(groups)) + 1
+        parts = [self.file.schema_arrow.empty_table().select(self.result_columns)]
+        for part in np.split(np.arange(len(rows)), bounds) if len(rows) else []:
+            group = groups[part[0]]
+            parts.append(self._read_group(group).take(rows[part] - self.group_starts[group]))
+        results = pa.concat_tables(parts).to_pandas()
+        # Возвращаем исходный порядок строк
+        return results.iloc[np.argsort(order)].reset_index(drop=True)
+
+    def split(self, chunk: pd.DataFrame, fingerprints: np.ndarray):
+        """Делит часть на строки для скоринга и готовые результаты прошлого запуска."""
+        customer_ids = chunk["CustomerId"].to_numpy(dtype=np.int64)
+        positions = np.searchsorted(self.ids, customer_ids).clip(max=max(len(self.ids) - 1, 0))
+        known = self.ids[positions] == customer_ids if len(self.ids) else np.zeros(len(chunk), dtype=bool)
+        self.seen[positions[known]] = True
+
+        unchanged = known & self.same_version
+        unchanged[known] &= self.fingerprints[positions[known]] == fingerprints[known]
+        reused = self.results_at(self.rows[positions[unchanged]]).set_index(chunk.index[unchanged])
+        stats = {"new": int((~known).sum()), "changed": int((known & ~unchanged).sum())}
+        return chunk[~unchanged], reused, stats
+
+    def deleted(self) -> int:
+        return int((~self.seen).sum())
+
+
+def peak_memory_mb() -> float:
+    # ru_maxrss в Linux измеряется в килобайтах
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return (own + children) / 1024
+
+
+def run(input_path: str, output_path: str, chunksize: int, workers: int, state_path: str = None) -> dict:
+    start = time.perf_counter()
+    backend.load_models()
+    writer = ResultWriter(output_path)
+    state = state_writer = None
+    report = {"scored": 0, "skipped": 0, "new": 0, "changed": 0, "scoring_seconds": 0.0}
+    if state_path:
+        version = models_version()
+        state = ScoringState(state_path, version) if os.path.exists(state_path) else None
+        state_writer = ResultWriter(state_path + ".tmp.parquet", metadata={b"model_version": version.encode()})
+
+    def flush(item):
+        future, reused, fingerprints = item
+        parts = [reused] if reused is not None else []
+        if future is not None:
+            scored, seconds = future.result()
+            report["scoring_seconds"] += seconds
+            parts.insert(0, scored)
+        result = pd.concat(parts).sort_index()
+        writer.write(result)
+        if state_writer is not None:
+            state_writer.write(result.assign(fingerprint=fingerprints.loc[result.index]))
+
+    pending = deque()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+            for chunk in read_chunks(input_path, chunksize):
+                fingerprints = None
+                to_score, reused = chunk, None
+                if state_writer is not None:
+                    fingerprints = pd.Series(feature_fingerprints(chunk), index=chunk.index)
+                if state is not None:
+                    to_score, reused, stats = state.split(chunk, fingerprints.to_numpy())
+                    report["new"] += stats["new"]
+                    report["changed"] += stats["changed"]
+                else:
+                    report["new"] += len(chunk)
+
+                report["scored"] += len(to_score)
+                report["skipped"] += len(chunk) - len(to_score)
+                future = pool.submit(score_chunk, to_score) if len(to_score) else None
+                pending.append((future, reused, fingerprints))
+                # Ограничиваем число частей в памяти и сохраняем порядок строк
+                while len(pending) >= 2 * workers:
+                    flush(pending.popleft())
+            while pending:
+                flush(pending.popleft())
+        elapsed = time.perf_counter() - start
+
+        # Полный пересчёт (ничего не пропущено) задаёт новую базовую скорость, дельта-запуск её сохраняет
+        full_rows_per_sec = writer.rows / elapsed if report["skipped"] == 0 and elapsed else None
+        if full_rows_per_sec is None and state is not None:
+            full_rows_per_sec = state.full_rows_per_sec
+        if state_writer is not None and full_rows_per_sec:
+            state_writer.add_metadata({b"full_rows_per_sec": str(full_rows_per_sec).encode()})
+    finally:
+        writer.close()
+        if state_writer is not None:
+            state_writer.close()
+
+    if state_writer is not None:
+        os.replace(state_writer.path, state_path)
+
+    report.update({
+        "rows": writer.rows,
+        "deleted": state.deleted() if state is not None else 0,
+        "seconds": round(elapsed, 2),
+        "rows_per_sec": round(writer.rows / elapsed) if elapsed else 0,
+        "peak_memory_mb": round(peak_memory_mb(), 1),
+    })
+    # Сэкономленное время: сколько занял бы полный пересчёт с измеренной ранее скоростью минус время запуска
+    if report["skipped"] and state is not None and state.full_rows_per_sec:
+        report["full_rescore_seconds"] = round(writer.rows / state.full_rows_per_sec, 2)
+        report["time_saved_seconds"] = round(report["full_rescore_seconds"] - elapsed, 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-скоринг файла с клиентами (CSV/Parquet)")
+    parser.add_argument("input", help="входной файл .csv или .parquet")
+    parser.add_argument("output", help="выходной файл .csv или .parquet")
+    parser.add_argument("--chunksize", type=int, default=100_000, help="строк в одной части")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="число процессов")
+    parser.add_argument("--state", help="файл состояния (.parquet) для дельта-режима")
+    args = parser.parse_args()
+
+    report = run(args.input, args.output, args.chunksize, args.workers, args.state)
+    print(f"Обработано строк: {report['rows']}")
+    if args.state:
+        print(f"Заново оценено: {report['scored']} (новых {report['new']}, изменившихся {report['changed']})")
+        print(f"Пропущено без изменений: {report['skipped']}, удалено с прошлого запуска: {report['deleted']}")
+        if "time_saved_seconds" in report:
+            print(f"Сэкономлено времени (оценка): {report['time_saved_seconds']} с "
+                  f"(полный пересчёт — около {report['full_rescore_seconds']} с)")
+    print(f"Время: {report['seconds']} с ({report['rows_per_sec']} строк/с)")
+    print(f"Пиковая память (основной процесс + максимум по воркерам): {report['peak_memory_mb']} МБ")
+
+
+if __name__ == "__main__":
+    main()
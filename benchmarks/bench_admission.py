@@ -0,0 +1,109 @@
+"""Нагрузочный тест контроля допуска: задержки /predict_batch при перегрузке.
+
+Поднимает бэкенд (uvicorn) в отдельном процессе дважды — без ограничений и с
+ограничениями — и отправляет concurrency параллельных потоков запросов. Выводит
+p50/p99 задержки для принятых запросов, число отказов (413/429/504) и p99 времени отказа.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_admission --concurrency 32 --batch-rows 5000 --duration 20
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+
+PORT = 8765
+
+
+def start_backend(env_overrides: dict) -> subprocess.Popen:
+    env = {**os.environ, **env_overrides}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend:app", "--port", str(PORT), "--log-level", "warning"],
+        env=env,
+    )
+    for _ in range(120):
+        try:
+            if requests.get(f"http://127.0.0.1:{PORT}/health/ready", timeout=1).status_code == 200:
+                return process
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    process.kill()
+    raise RuntimeError("Бэкенд не запустился")
+
+
+def run_load(payload: dict, concurrency: int, duration: float):
+    latencies, statuses = [], []
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def worker():
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            retry_after = 0
+            try:
+                response = session.post(f"http://127.0.0.1:{PORT}/predict_batch", json=payload,
+                                        headers={"X-Request-Timeout": "10"}, timeout=30)
+                status = response.status_code
+                retry_after = float(response.headers.get("Retry-After", 0))
+            except requests.RequestException:
+                status = 0
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                statuses.append(status)
+            # Клиент соблюдает Retry-After, как и положено при отказе 429
+            time.sleep(retry_after)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.array(latencies), np.array(statuses)
+
+
+def report(label: str, latencies: np.ndarray, statuses: np.ndarray, duration: float):
+    ok = statuses == 200
+    accepted = latencies[ok]
+    p50, p99 = (np.percentile(accepted, [50, 99]) if len(accepted) else (float("nan"),) * 2)
+    rejected = latencies[~ok]
+    rejected_p99 = np.percentile(rejected, 99) if len(rejected) else float("nan")
+    print(f"{label:>16}: принято {ok.sum():>5} ({ok.sum() / duration:6.1f}/с), "
+          f"p50 {p50 * 1000:8.1f} мс, p99 {p99 * 1000:8.1f} мс; "
+          f"отказов {len(rejected):>5}, p99 отказа {rejected_p99 * 1000:6.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batch-rows", type=int, default=5000)
+    parser.add_argument("--duration", type=float, default=20)
+    args = parser.parse_args()
+
+    data = pd.read_csv("train_models/Churn_Modelling.csv")
+    batch = data.sample(args.batch_rows, replace=True, random_state=0)
+    payload = {"clients": batch.to_dict(orient="records")}
+
+    configs = {
+        "без ограничений": {"MAX_INFLIGHT_ROWS": str(10 ** 9), "MAX_QUEUE_DEPTH": str(10 ** 6)},
+        "с ограничениями": {"MAX_INFLIGHT_ROWS": str(2 * args.batch_rows), "MAX_QUEUE_DEPTH": "4"},
+    }
+    for label, env in configs.items():
+        process = start_backend(env)
+        try:
+            latencies, statuses = run_load(payload, args.concurrency, args.duration)
+        finally:
+            process.terminate()
+            process.wait()
+        report(label, latencies, statuses, args.duration)
+
+
+if __name__ == "__main__":
+    main()
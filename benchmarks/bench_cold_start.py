@@ -0,0 +1,89 @@
+"""Время холодного старта бэкенда: от запуска процесса до первого быстрого ответа.
+
+Бэкенд (uvicorn) запускается в отдельном процессе в трёх режимах: прежний старт
+(STARTUP_MODE=sequential: модели загружаются по очереди до приёма запросов, без
+прогрева), фоновая параллельная загрузка без прогрева (STARTUP_WARMUP_ROWS=0) и с
+прогревом. Для каждого запуска измеряется время до liveness и
+readiness, задержка первого и последующих /predict_batch и время до первого
+успешного ответа; выводится также разбивка /health/startup.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_cold_start --runs 3
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import pandas as pd
+import requests
+
+PORT = 8766
+URL = f"http://127.0.0.1:{PORT}"
+
+
+def wait_for(path: str, started: float, timeout: float = 120) -> float:
+    while time.perf_counter() - started < timeout:
+        try:
+            if requests.get(URL + path, timeout=1).status_code == 200:
+                return time.perf_counter() - started
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"{path} не ответил за {timeout} с")
+
+
+def cold_start(payload: dict, mode: str, warmup_rows: int) -> dict:
+    env = {**os.environ, "STARTUP_MODE": mode, "STARTUP_WARMUP_ROWS": str(warmup_rows)}
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend:app", "--port", str(PORT), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        live = wait_for("/health/live", started)
+        ready = wait_for("/health/ready", started)
+        latencies = []
+        for _ in range(5):
+            request_started = time.perf_counter()
+            requests.post(URL + "/predict_batch", json=payload).raise_for_status()
+            latencies.append(time.perf_counter() - request_started)
+        timings = requests.get(URL + "/health/startup").json()["timings"]
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        "live": live,
+        "ready": ready,
+        "first_request": latencies[0],
+        "warm_request": statistics.median(latencies[1:]),
+        "first_fast_response": ready + latencies[0],
+        "timings": timings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--batch-rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    data = pd.read_csv("train_models/Churn_Modelling.csv")
+    payload = {"clients": data.sample(args.batch_rows, random_state=0).to_dict(orient="records")}
+
+    modes = (("прежний старт", "sequential", 0), ("параллельно без прогрева", "background", 0),
+             ("параллельно с прогревом", "background", 256))
+    for label, mode, warmup_rows in modes:
+        runs = [cold_start(payload, mode, warmup_rows) for _ in range(args.runs)]
+        median = {key: statistics.median(run[key] for run in runs) for key in runs[0] if key != "timings"}
+        print(f"{label}: live {median['live']:.2f} с, ready {median['ready']:.2f} с, "
+              f"первый запрос {median['first_request'] * 1000:.0f} мс, "
+              f"прогретый запрос {median['warm_request'] * 1000:.0f} мс, "
+              f"до первого ответа {median['first_fast_response']:.2f} с")
+        print("    этапы старта:", runs[-1]["timings"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Повторяющиеся CustomerId: время и память скоринга и соединения с признаками.
+
+Для долей повторов 0%, 10% и 50% сравнивает:
+- скоринг всех строк как раньше и с этапом deduplicate_clients (keep_last, fanout);
+- соединение результатов с исходными признаками: прежний pd.merge по CustomerId
+  (многие-ко-многим при повторах) и соединение по индексу CustomerId (последняя запись).
+Память — пик выделений Python/numpy/pandas по tracemalloc (без памяти внутри xgboost).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_dedup --rows 200000
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import backend
+
+COLUMNS = ["CustomerId", "Geography", "CreditScore", "Age", "Tenure", "Balance", "NumOfProducts",
+           "HasCrCard", "IsActiveMember", "EstimatedSalary", "Gender"]
+FEATURES = ["CustomerId", "Age", "NumOfProducts", "IsActiveMember", "Balance", "Gender"]
+
+
+def make_input(rows: int, duplicate_share: float) -> pd.DataFrame:
+    source = pd.read_csv("train_models/Churn_Modelling.csv")[COLUMNS]
+    unique_rows = int(rows * (1 - duplicate_share))
+    unique = source.sample(unique_rows, replace=True, random_state=0).reset_index(drop=True)
+    unique["CustomerId"] = np.arange(unique_rows) + 10_000_000
+    copies = unique.sample(rows - unique_rows, replace=True, random_state=1)
+    return pd.concat([unique, copies], ignore_index=True).sample(frac=1, random_state=2).reset_index(drop=True)
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / 2 ** 20
+
+
+def score(df: pd.DataFrame, policy: str = None) -> pd.DataFrame:
+    if policy is None:
+        return backend.score_clients(df.copy())
+    unique, representatives = backend.deduplicate_clients(df.copy(), policy)
+    results = backend.score_clients(unique)
+    if representatives is not None:
+        results = backend.fan_out_results(results, df.index, representatives)
+    return results
+
+
+def indexed_join(results: pd.DataFrame, raw: pd.DataFrame) -> pd.DataFrame:
+    features = raw.loc[~raw["CustomerId"].duplicated(keep="last"), FEATURES].set_index("CustomerId")
+    return results.join(features, on="CustomerId")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--shares", type=float, nargs="+", default=[0.0, 0.1, 0.5])
+    args = parser.parse_args()
+
+    backend.load_models()
+    for share in args.shares:
+        df = make_input(args.rows, share)
+        print(f"Повторов {share:.0%} ({args.rows} строк, уникальных CustomerId {df['CustomerId'].nunique()}):")
+        score(df.head(1000))  # прогрев
+
+        for label, policy in [("все строки", None), ("keep_last", "keep_last"), ("fanout", "fanout")]:
+            results, seconds, peak = measure(lambda: score(df, policy))
+            print(f"    скоринг {label:<10}: {seconds:6.2f} с, пик {peak:7.1f} МБ, строк результата {len(results)}")
+
+        results = score(df, None)
+        merged, seconds, peak = measure(lambda: pd.merge(results, df[FEATURES], on="CustomerId", how="left"))
+        print(f"    pd.merge по CustomerId: {seconds:6.3f} с, пик {peak:7.1f} МБ, строк {len(merged)}")
+        results = score(df, "keep_last")
+        joined, seconds, peak = measure(lambda: indexed_join(results, df))
+        print(f"    join по индексу       : {seconds:6.3f} с, пик {peak:7.1f} МБ, строк {len(joined)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Выгрузка результатов: прежний to_csv в памяти Streamlit против потоковой выгрузки бэкенда.
+
+Каждый способ запускается в отдельном процессе на одних и тех же синтетических
+результатах. Измеряются время выгрузки и пик памяти, выделенной во время выгрузки:
+tracemalloc (Python, numpy, pandas) плюс пик пула памяти pyarrow. RSS процесса для
+этого не подходит: память, освобождённая при подготовке данных, переиспользуется и
+прирост RSS занижен. Потоковые варианты отдают части в /dev/null, как если бы они
+уходили в сеть.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_export --rows 1000000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from result_store import ScoredRun, csv_chunks, parquet_chunks
+
+MODES = {
+    "to_csv в памяти (было)": "inmemory",
+    "поток CSV": "csv",
+    "поток Parquet": "parquet",
+    "поток CSV с признаками": "csv_features",
+}
+
+
+def make_data(rows: int):
+    rng = np.random.default_rng(0)
+    probability = rng.random(rows).round(4)
+    results = pd.DataFrame({
+        "CustomerId": np.arange(rows) + 10_000_000,
+        "Geography": rng.choice(["France", "Germany", "Spain"], rows),
+        "prediction": (probability >= 0.5).astype(int),
+        "churn_probability": probability,
+    })
+    features = pd.DataFrame({
+        "CreditScore": rng.integers(350, 851, rows).astype(float),
+        "Age": rng.integers(18, 93, rows).astype(float),
+        "Tenure": rng.integers(0, 11, rows).astype(float),
+        "Balance": rng.uniform(0, 250000, rows).round(2),
+        "NumOfProducts": rng.integers(1, 5, rows).astype(float),
+        "HasCrCard": rng.integers(0, 2, rows),
+        "IsActiveMember": rng.integers(0, 2, rows),
+        "EstimatedSalary": rng.uniform(0, 200000, rows).round(2),
+        "Gender": rng.choice(["Male", "Female"], rows),
+    })
+    return results, features
+
+
+def export(mode: str, results: pd.DataFrame, run: ScoredRun) -> int:
+    """Выполняет выгрузку и возвращает её размер в байтах."""
+    if mode == "inmemory":
+        # Как раньше в streamlit_app.py: весь файл кодируется при каждом перезапуске скрипта
+        return len(results.to_csv(index=False).encode("utf-8"))
+    size = 0
+    frames = run.frames(100_000, include_features=mode == "csv_features")
+    chunks = parquet_chunks(frames) if mode == "parquet" else csv_chunks(frames)
+    with open(os.devnull, "wb") as sink:
+        for chunk in chunks:
+            sink.write(chunk)
+            size += len(chunk)
+    return size
+
+
+def run_mode(mode: str, rows: int):
+    results, features = make_data(rows)
+    run = ScoredRun(results, features) if mode != "inmemory" else None
+
+    # Время и память измеряются отдельными проходами: tracemalloc сильно замедляет to_csv
+    started = time.perf_counter()
+    size = export(mode, results, run)
+    seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    export(mode, results, run)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Подготовка данных pyarrow не использует, поэтому пик пула относится к выгрузке
+    peak += pa.default_memory_pool().max_memory()
+    print(f"{seconds:.3f} {peak / 2 ** 20:.1f} {size / 2 ** 20:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--mode", choices=list(MODES.values()))
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.rows)
+        return
+
+    print(f"{args.rows} строк:")
+    for label, mode in MODES.items():
+        output = subprocess.run([sys.executable, "-m", "benchmarks.bench_export", "--rows", str(args.rows),
+                                 "--mode", mode], capture_output=True, text=True, check=True).stdout
+        seconds, peak, size = output.split()[-3:]
+        print(f"    {label:<24}: {float(seconds):6.2f} с, пик памяти {float(peak):7.1f} МБ, "
+              f"файл {float(size):6.1f} МБ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Время получения страницы результатов в зависимости от размера результата.
+
+Сравнивает ScoredRun.page (индекс строится один раз на прогон) с прежним подходом —
+фильтрацией и сортировкой всего DataFrame при каждом показе таблицы.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_results_page --rows 100000 1000000 5000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from result_store import ScoredRun
+
+QUERIES = {
+    "без фильтров": {},
+    "страна + предсказание": {"country": "Germany", "prediction": 1},
+    "диапазон вероятности": {"min_probability": 0.3, "max_probability": 0.6},
+    "по CustomerId + страна": {"sort_by": "CustomerId", "descending": False, "country": "Spain"},
+}
+
+
+def make_results(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    probability = rng.random(rows).round(4)
+    return pd.DataFrame({
+        "CustomerId": rng.permutation(rows) + 10_000_000,
+        "Geography": rng.choice(["France", "Germany", "Spain"], rows),
+        "prediction": (probability >= 0.5).astype(int),
+        "churn_probability": probability,
+    })
+
+
+def naive_page(df: pd.DataFrame, offset: int, limit: int, sort_by="churn_probability", descending=True,
+               country=None, prediction=None, min_probability=None, max_probability=None):
+    mask = np.ones(len(df), dtype=bool)
+    if country is not None:
+        mask &= df["Geography"].to_numpy() == country
+    if prediction is not None:
+        mask &= df["prediction"].to_numpy() == prediction
+    if min_probability is not None:
+        mask &= df["churn_probability"].to_numpy() >= min_probability
+    if max_probability is not None:
+        mask &= df["churn_probability"].to_numpy() <= max_probability
+    filtered = df[mask].sort_values(sort_by, ascending=not descending)
+    return len(filtered), filtered.iloc[offset:offset + limit]
+
+
+def median_ms(fn, repeats: int) -> float:
+    times = []
+    for page in range(repeats):
+        started = time.perf_counter()
+        fn(page * 50)
+        times.append(time.perf_counter() - started)
+    return np.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        results = make_results(rows)
+        started = time.perf_counter()
+        run = ScoredRun(results)
+        print(f"{rows:>9} строк: индекс построен за {time.perf_counter() - started:.2f} с")
+        for label, query in QUERIES.items():
+            indexed = median_ms(lambda offset: run.page(offset, 50, **query), args.repeats)
+            naive = median_ms(lambda offset: naive_page(results, offset, 50, **query), max(args.repeats // 4, 3))
+            print(f"    {label:<24}: индекс {indexed:7.2f} мс, фильтр и сортировка {naive:8.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
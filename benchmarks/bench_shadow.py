@@ -0,0 +1,51 @@
+"""Влияние теневого скоринга на задержку основной модели.
+
+Бэкенд запускается без претендентов и с претендентами для всех стран (копии
+текущих моделей во временной папке CHALLENGER_DIR) и нагружается одинаковым
+потоком /predict_batch. Сравниваются p50/p99 задержки ответов; для запуска с
+претендентами выводится также отчёт /admin/shadow (в том числе отброшенные задания).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_shadow --concurrency 8 --batch-rows 2000 --duration 20
+"""
+import argparse
+import shutil
+import tempfile
+
+import pandas as pd
+import requests
+
+from backend import MODEL_PATHS
+from benchmarks.bench_admission import PORT, report, run_load, start_backend
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-rows", type=int, default=2000)
+    parser.add_argument("--duration", type=float, default=20)
+    args = parser.parse_args()
+
+    data = pd.read_csv("train_models/Churn_Modelling.csv")
+    payload = {"clients": data.sample(args.batch_rows, replace=True, random_state=0).to_dict(orient="records")}
+
+    with tempfile.TemporaryDirectory() as challenger_dir, tempfile.TemporaryDirectory() as empty_dir:
+        for country, path in MODEL_PATHS.items():
+            shutil.copy(path, f"{challenger_dir}/challenger_{country.lower()}.pkl")
+
+        for label, directory in (("без претендентов", empty_dir), ("с претендентами", challenger_dir)):
+            process = start_backend({"CHALLENGER_DIR": directory})
+            try:
+                latencies, statuses = run_load(payload, args.concurrency, args.duration)
+                shadow = requests.get(f"http://127.0.0.1:{PORT}/admin/shadow").json()
+            finally:
+                process.terminate()
+                process.wait()
+            report(label, latencies, statuses, args.duration)
+            for country, stats in shadow["countries"].items():
+                print(f"    {country}: пакетов {stats['batches']}, отброшено {stats['dropped_batches']}, "
+                      f"совпадение {stats['agreement_rate']}, challenger {stats['challenger_latency']}")
+
+
+if __name__ == "__main__":
+    main()
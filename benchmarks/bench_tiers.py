@@ -0,0 +1,72 @@
+"""Уровни моделей (full и fast): задержка против точности.
+
+Для каждого уровня выводит медианную задержку predict_proba (только модель) и
+score_clients (весь путь скоринга без HTTP) на пакетах разного размера, а также
+ROC-AUC на тестовой части каждой страны (то же разбиение, что в ноутбуке обучения)
+и долю совпадения предсказаний с полной моделью.
+
+Запуск из корня проекта (компактные модели создаются train_models/distill_models.py):
+    python -m benchmarks.bench_tiers --batch-rows 1 100 10000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import backend
+from train_models.distill_models import FEATURES, notebook_split, roc_auc
+
+
+def median_ms(fn, repeats: int) -> float:
+    fn()
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return np.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-rows", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    backend.load_models()
+    backend.load_fast_models()
+    data = pd.read_csv("train_models/Churn_Modelling.csv", index_col="RowNumber")
+    data["Gender_Male"] = (data["Gender"] == "Male").astype(float)
+
+    print("Задержка (медиана, мс), страна France:")
+    for rows in args.batch_rows:
+        batch = data[data["Geography"] == "France"].sample(rows, replace=True, random_state=0)
+        clients = batch.reset_index()[["CustomerId", "Geography", "Gender"] + FEATURES[:-1]]
+        repeats = max(args.repeats * 100 // max(rows, 100), 5)
+        line = []
+        for tier, bundles in [("full", backend.model_bundles), ("fast", backend.fast_bundles)]:
+            model = bundles["France"]["model"]
+            model_ms = median_ms(lambda: model.predict_proba(batch[FEATURES]), repeats)
+            score_ms = median_ms(lambda: backend.score_clients(clients.copy(), tier=tier), repeats)
+            line.append(f"{tier}: модель {model_ms:8.3f}, score_clients {score_ms:8.3f}")
+        print(f"    {rows:>6} строк — " + "; ".join(line))
+
+    print("Точность на тестовой части:")
+    for country in backend.MODEL_PATHS:
+        country_data = data[data["Geography"] == country]
+        _, X_test, _, y_test = notebook_split(country_data[FEATURES], country_data["Exited"])
+        full = backend.model_bundles[country]
+        full_probs = full["model"].predict_proba(X_test)[:, 1]
+        line = f"    {country:>8}: full ROC-AUC {roc_auc(y_test, full_probs):.4f}"
+        if country in backend.fast_bundles:
+            fast = backend.fast_bundles[country]
+            fast_probs = fast["model"].predict_proba(X_test)[:, 1]
+            agreement = ((fast_probs >= fast["threshold"]) == (full_probs >= full["threshold"])).mean()
+            line += (f", fast ROC-AUC {roc_auc(y_test, fast_probs):.4f}, "
+                     f"совпадение предсказаний {agreement:.3f}, деревьев {fast['n_trees']}")
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
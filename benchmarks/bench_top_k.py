@@ -0,0 +1,62 @@
+"""Сравнение выбора топ-K через полную сортировку и через select_top_k.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_top_k --rows 1000000 10000000 --k 10
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from backend import select_top_k
+
+
+def make_results(n_rows: int, seed: int = 42) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "CustomerId": np.arange(n_rows, dtype=np.int64),
+        "Geography": pd.Categorical.from_codes(rng.integers(0, 3, n_rows), ["France", "Germany", "Spain"]),
+        "NumOfProducts": rng.integers(1, 5, n_rows),
+        "churn_probability": rng.random(n_rows).astype(np.float32),
+    })
+
+
+def full_sort_top_k(df: pd.DataFrame, k: int, group_by) -> pd.DataFrame:
+    ordered = df.sort_values("churn_probability", ascending=False)
+    if group_by:
+        return ordered.groupby(group_by, observed=True).head(k)
+    return ordered.head(k)
+
+
+def timed(func, *args, repeats: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'group_by':>26} {'full sort, s':>13} {'top-k, s':>10} {'speedup':>8}")
+    for n_rows in args.rows:
+        df = make_results(n_rows)
+        for group_by in (None, ["Geography"], ["Geography", "NumOfProducts"]):
+            expected = full_sort_top_k(df, args.k, group_by)
+            actual = select_top_k(df, args.k, group_by)
+            assert sorted(expected["churn_probability"]) == sorted(actual["churn_probability"])
+
+            t_sort = timed(full_sort_top_k, df, args.k, group_by)
+            t_top = timed(select_top_k, df, args.k, group_by)
+            label = ",".join(group_by) if group_by else "-"
+            print(f"{n_rows:>10} {label:>26} {t_sort:>13.3f} {t_top:>10.3f} {t_sort / t_top:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Сравнение транспорта Streamlit → бэкенд: байты в сети и время запроса.
+
+«До» — как раньше делал streamlit_app.py: разовый requests.post(json=...) со всеми
+столбцами файла и ответ без сжатия; «после» — общая сессия с keep-alive,
+тело в JSON, сжатое zstd, и ответ, сжатый кодировкой, которую умеет распаковывать
+urllib3 (zstd или gzip). Байты считаются по телу запроса и
+заголовку Content-Length ответа (т. е. как они идут по сети).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_transport --rows 200000 --repeats 3
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+from urllib3.util.request import ACCEPT_ENCODING
+
+from benchmarks.bench_admission import PORT, start_backend
+from http_compression import compress
+
+API_FIELDS = ["CustomerId", "Geography", "CreditScore", "Age", "Tenure", "Balance", "NumOfProducts",
+              "HasCrCard", "IsActiveMember", "EstimatedSalary", "Gender", "Gender_Male"]
+
+
+def send_before(data: pd.DataFrame):
+    started = time.perf_counter()
+    payload = {"clients": data.to_dict(orient="records")}
+    response = requests.post(f"http://127.0.0.1:{PORT}/predict_batch", json=payload,
+                             headers={"Accept-Encoding": "identity"})
+    response.raise_for_status()
+    pd.DataFrame(response.json())
+    seconds = time.perf_counter() - started
+    return seconds, len(response.request.body), int(response.headers["content-length"])
+
+
+def send_after(session: requests.Session, data: pd.DataFrame):
+    started = time.perf_counter()
+    columns = [column for column in API_FIELDS if column in data.columns]
+    body = compress(('{"clients":' + data[columns].to_json(orient="records") + "}").encode(), "zstd")
+    response = session.post(f"http://127.0.0.1:{PORT}/predict_batch", data=body,
+                            headers={"Content-Type": "application/json", "Content-Encoding": "zstd"},
+                            timeout=(3.05, 300))
+    response.raise_for_status()
+    pd.DataFrame(response.json())
+    seconds = time.perf_counter() - started
+    return seconds, len(body), int(response.headers["content-length"])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    data = pd.read_csv("train_models/Churn_Modelling.csv")
+    data = data.sample(args.rows, replace=True, random_state=0).reset_index(drop=True)
+    data["CustomerId"] = np.arange(len(data)) + 10_000_000
+
+    session = requests.Session()
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+
+    process = start_backend({})
+    try:
+        results = {"до": [], "после": []}
+        for _ in range(args.repeats):
+            results["до"].append(send_before(data))
+            results["после"].append(send_after(session, data))
+    finally:
+        process.terminate()
+        process.wait()
+
+    for label, runs in results.items():
+        seconds = np.median([run[0] for run in runs])
+        sent, received = runs[0][1], runs[0][2]
+        print(f"{label:>6}: запрос {sent / 2 ** 20:7.2f} МБ, ответ {received / 2 ** 20:7.2f} МБ, "
+              f"медиана времени {seconds:6.2f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""Сквозное нагрузочное тестирование бэкенда по HTTP.
+
+Инструмент на asyncio без внешних сервисов и зависимостей (свой минимальный
+HTTP/1.1-клиент с keep-alive). Бэкенд запускается через uvicorn для каждого
+значения --workers; на каждом уровне нагрузки в течение --duration секунд
+отправляются запросы к эндпоинтам скоринга с пакетами из Churn_Modelling.csv.
+
+Режимы подачи нагрузки:
+    closed — фиксированное число клиентов (--levels — значения concurrency),
+             каждый отправляет следующий запрос сразу после ответа;
+    open   — пуассоновский поток с заданной интенсивностью (--levels — запросов/с)
+             независимо от времени ответа.
+
+Смесь эндпоинтов и размеров пакетов задаётся весами, например
+--endpoints predict_batch=8,predict_top_k=1,predict_scenarios=1 --batch-sizes 10=5,1000=3,10000=1.
+
+Отчёт (JSON, Markdown-таблица и график throughput/latency) сохраняется в --output,
+его удобно хранить между релизами и сравнивать.
+
+Запуск из корня проекта:
+    python -m benchmarks.load_test --mode closed --levels 1,2,4,8,16 --workers 1,2,4 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import matplotlib
+import numpy as np
+import pandas as pd
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+
+HOST = "127.0.0.1"
+PORT = 8767
+
+# Пути запросов для эндпоинтов скоринга
+ENDPOINT_PATHS = {
+    "predict_batch": "/predict_batch",
+    "predict_top_k": "/predict_top_k?k=10&group_by=Geography",
+    "predict_scenarios": "/predict_scenarios",
+}
+
+SCENARIOS = [
+    {"name": "active", "set": {"IsActiveMember": 1}},
+    {"name": "plus_product", "add": {"NumOfProducts": 1}},
+]
+
+# Прирост пропускной способности меньше этой доли означает насыщение
+SATURATION_GAIN = 0.05
+
+
+class HttpConnection:
+    """Минимальное HTTP/1.1-соединение с keep-alive поверх asyncio streams."""
+
+    def __init__(self):
+        self.reader = self.writer = None
+
+    async def request(self, method: str, path: str, body: bytes = b"") -> int:
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {HOST}:{PORT}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n")
+        try:
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(HOST, PORT)
+            self.writer.write(head.encode() + body)
+            await self.writer.drain()
+            status = int((await self.reader.readline()).split()[1])
+            length, chunked, close = 0, False, False
+            while True:
+                line = await self.reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                name, value = name.strip().lower(), value.strip().lower()
+                if name == "content-length":
+                    length = int(value)
+                elif name == "transfer-encoding":
+                    chunked = "chunked" in value
+                elif name == "connection":
+                    close = value == "close"
+            if chunked:
+                while True:
+                    size = int((await self.reader.readline()).strip(), 16)
+                    await self.reader.readexactly(size + 2)
+                    if size == 0:
+                        break
+            else:
+                await self.reader.readexactly(length)
+        except (OSError, asyncio.IncompleteReadError, IndexError, ValueError):
+            self.close()
+            return 0
+        if close:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def parse_weights(spec: str, cast=str) -> dict:
+    weights = {}
+    for item in spec.split(","):
+        key, _, weight = item.partition("=")
+        weights[cast(key.strip())] = float(weight or 1)
+    return weights
+
+
+def build_payloads(data: pd.DataFrame, endpoints: dict, batch_sizes: dict, variants: int = 3) -> list:
+    """Заранее сериализованные запросы: (эндпоинт, размер, путь, тело, вес)."""
+    rng = np.random.default_rng(0)
+    payloads = []
+    for endpoint, endpoint_weight in endpoints.items():
+        for size, size_weight in batch_sizes.items():
+            for _ in range(variants):
+                rows = data.sample(size, replace=size > len(data), random_state=int(rng.integers(1 << 31)))
+                body = {"clients": rows.to_dict(orient="records")}
+                if endpoint == "predict_scenarios":
+                    body["scenarios"] = SCENARIOS
+                payloads.append((endpoint, size, ENDPOINT_PATHS[endpoint], json.dumps(body).encode(),
+                                 endpoint_weight * size_weight / variants))
+    return payloads
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = []  # (эндпоинт, размер, статус, задержка)
+
+    def add(self, endpoint, size, status, seconds):
+        self.samples.append((endpoint, size, status, seconds))
+
+    def summary(self, duration: float) -> dict:
+        frame = pd.DataFrame(self.samples, columns=["endpoint", "size", "status", "seconds"])
+        ok = frame[frame["status"] == 200]
+        latencies = ok["seconds"].to_numpy()
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) if len(latencies) else (float("nan"),) * 3
+        return {
+            "requests": len(frame),
+            "ok": len(ok),
+            "errors": int((frame["status"] != 200).sum()),
+            "status_counts": {str(k): int(v) for k, v in frame["status"].value_counts().items()},
+            "throughput_rps": len(ok) / duration,
+            "rows_per_sec": float(ok["size"].sum()) / duration,
+            "p50_ms": p50 * 1000,
+            "p90_ms": p90 * 1000,
+            "p99_ms": p99 * 1000,
+            "p99_ms_by_endpoint": {endpoint: float(np.percentile(group["seconds"], 99) * 1000)
+                                   for endpoint, group in ok.groupby("endpoint")},
+        }
+
+
+async def send(connection: HttpConnection, payload, recorder: Recorder):
+    endpoint, size, path, body, _ = payload
+    started = time.perf_counter()
+    status = await connection.request("POST", path, body)
+    recorder.add(endpoint, size, status, time.perf_counter() - started)
+
+
+async def run_closed(payloads, weights, concurrency: int, duration: float) -> Recorder:
+    recorder = Recorder()
+    stop_at = time.perf_counter() + duration
+
+    async def client(seed):
+        rng = random.Random(seed)
+        connection = HttpConnection()
+        while time.perf_counter() < stop_at:
+            await send(connection, rng.choices(payloads, weights)[0], recorder)
+        connection.close()
+
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    return recorder
+
+
+async def run_open(payloads, weights, rate: float, duration: float, max_in_flight: int = 512) -> Recorder:
+    recorder = Recorder()
+    rng = random.Random(0)
+    idle = []
+    in_flight = set()
+
+    async def one(payload):
+        connection = idle.pop() if idle else HttpConnection()
+        await send(connection, payload, recorder)
+        idle.append(connection)
+
+    stop_at = time.perf_counter() + duration
+    next_at = time.perf_counter()
+    while next_at < stop_at:
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+        payload = rng.choices(payloads, weights)[0]
+        if len(in_flight) >= max_in_flight:
+            # Клиент не успевает: запрос учитывается как отказ со статусом -1
+            recorder.add(payload[0], payload[1], -1, 0.0)
+        else:
+            task = asyncio.create_task(one(payload))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        next_at += rng.expovariate(rate)
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    for connection in idle:
+        connection.close()
+    return recorder
+
+
+async def wait_ready(workers: int, timeout: float = 180):
+    # Каждый воркер uvicorn прогревается отдельно — ждём серию успешных ответов подряд
+    connection = HttpConnection()
+    started, streak = time.perf_counter(), 0
+    while time.perf_counter() - started < timeout:
+        status = await connection.request("GET", "/health/ready")
+        if status != 200:
+            connection.close()
+        streak = streak + 1 if status == 200 else 0
+        if streak >= 4 * workers:
+            connection.close()
+            return
+        await asyncio.sleep(0.05 if status == 200 else 0.5)
+    raise RuntimeError("Бэкенд не стал готов")
+
+
+def start_backend(workers: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend:app", "--host", HOST, "--port", str(PORT),
+         "--workers", str(workers), "--log-level", "warning"],
+    )
+
+
+def saturation_point(steps: list) -> dict:
+    """Первый уровень, после которого пропускная способность растёт меньше чем на SATURATION_GAIN."""
+    for previous, current in zip(steps, steps[1:]):
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 + SATURATION_GAIN):
+            return {"level": previous["level"], "throughput_rps": previous["throughput_rps"],
+                    "p99_ms": previous["p99_ms"]}
+    return None
+
+
+def write_report(report: dict, output: str):
+    os.makedirs(output, exist_ok=True)
+    stamp = report["started"].replace(":", "").replace("-", "")
+    base = os.path.join(output, f"load_test_{stamp}")
+
+    with open(base + ".json", "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    level_name = "concurrency" if report["mode"] == "closed" else "rate, req/s"
+    lines = [f"# Нагрузочный тест {report['started']}", "",
+             f"Режим: {report['mode']}, эндпоинты: {report['endpoints']}, пакеты: {report['batch_sizes']}, "
+             f"длительность шага: {report['duration']} с", ""]
+    for run in report["runs"]:
+        lines += [f"## Воркеров uvicorn: {run['workers']}", "",
+                  f"| {level_name} | req/s | строк/с | p50, мс | p90, мс | p99, мс | ошибок |",
+                  "|---|---|---|---|---|---|---|"]
+        for step in run["steps"]:
+            lines.append(f"| {step['level']} | {step['throughput_rps']:.1f} | {step['rows_per_sec']:.0f} | "
+                         f"{step['p50_ms']:.0f} | {step['p90_ms']:.0f} | {step['p99_ms']:.0f} | {step['errors']} |")
+        saturation = run["saturation"]
+        lines += ["", f"Насыщение: {level_name} = {saturation['level']}, {saturation['throughput_rps']:.1f} req/s, "
+                      f"p99 {saturation['p99_ms']:.0f} мс" if saturation else "Насыщение не достигнуто", ""]
+    with open(base + ".md", "w") as f:
+        f.write("\n".join(lines))
+
+    fig, ax = plt.subplots(figsize=(8, 5))
+    for run in report["runs"]:
+        ax.plot([s["throughput_rps"] for s in run["steps"]], [s["p99_ms"] for s in run["steps"]],
+                marker="o", label=f"workers={run['workers']}")
+    ax.set_xlabel("Пропускная способность, req/s")
+    ax.set_ylabel("p99, мс")
+    ax.set_title("Задержка в зависимости от пропускной способности")
+    ax.grid(True, linestyle="--", alpha=0.7)
+    ax.legend()
+    fig.savefig(base + ".png", bbox_inches="tight")
+    plt.close(fig)
+    return base
+
+
+async def main_async(args):
+    endpoints = parse_weights(args.endpoints)
+    unknown = [endpoint for endpoint in endpoints if endpoint not in ENDPOINT_PATHS]
+    if unknown:
+        raise SystemExit(f"Неизвестные эндпоинты: {unknown}")
+    batch_sizes = parse_weights(args.batch_sizes, int)
+    levels = [float(level) if args.mode == "open" else int(level) for level in args.levels.split(",")]
+
+    data = pd.read_csv(args.data)
+    payloads = build_payloads(data, endpoints, batch_sizes)
+    weights = [payload[4] for payload in payloads]
+
+    report = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "mode": args.mode,
+        "endpoints": endpoints,
+        "batch_sizes": batch_sizes,
+        "duration": args.duration,
+        "cpu_count": os.cpu_count(),
+        "runs": [],
+    }
+    for workers in [int(w) for w in args.workers.split(",")]:
+        process = start_backend(workers)
+        try:
+            await wait_ready(workers)
+            steps = []
+            for level in levels:
+                if args.mode == "closed":
+                    recorder = await run_closed(payloads, weights, level, args.duration)
+                else:
+                    recorder = await run_open(payloads, weights, level, args.duration)
+                step = {"level": level, **recorder.summary(args.duration)}
+                steps.append(step)
+                print(f"workers={workers} level={level}: {step['throughput_rps']:.1f} req/s, "
+                      f"p50 {step['p50_ms']:.0f} мс, p99 {step['p99_ms']:.0f} мс, ошибок {step['errors']}")
+        finally:
+            process.terminate()
+            process.wait()
+        report["runs"].append({"workers": workers, "steps": steps, "saturation": saturation_point(steps)})
+
+    base = write_report(report, args.output)
+    print(f"Отчёт: {base}.md, {base}.json, {base}.png")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочное тестирование эндпоинтов скоринга")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="concurrency (closed) или запросов/с (open)")
+    parser.add_argument("--workers", default="1,2,4", help="числа воркеров uvicorn через запятую")
+    parser.add_argument("--endpoints", default="predict_batch=8,predict_top_k=1,predict_scenarios=1")
+    parser.add_argument("--batch-sizes", default="10=5,1000=3,10000=1", help="размер=вес через запятую")
+    parser.add_argument("--duration", type=float, default=20, help="секунд на каждый уровень нагрузки")
+    parser.add_argument("--data", default="train_models/Churn_Modelling.csv")
+    parser.add_argument("--output", default="benchmarks/reports")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
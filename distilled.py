@@ -0,0 +1,83 @@
+"""Компактные (дистиллированные) модели для быстрого онлайн-скоринга.
+
+DistilledModel — небольшой ансамбль неглубоких деревьев xgboost, обученный на
+вероятностях полной модели (см. train_models/distill_models.py). Деревья переводятся
+в плоские массивы numpy и вычисляются без xgboost: для всех деревьев и строк сразу
+делается столько шагов спуска, какова глубина дерева. Интерфейс predict_proba
+совпадает с XGBClassifier, поэтому бандл {"model", "threshold", ...} используется в
+backend.py так же, как бандл полной модели.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+
+class DistilledModel:
+    def __init__(self, booster, feature_names: list):
+        """Переводит деревья обученного xgboost.Booster (binary:logistic) в массивы."""
+        self.feature_names = list(feature_names)
+        config = json.loads(booster.save_config())
+        base_score = float(config["learner"]["learner_model_param"]["base_score"])
+        self.base_margin = float(np.log(base_score / (1 - base_score)))
+
+        trees = [self._flatten(json.loads(dump)) for dump in booster.get_dump(dump_format="json")]
+        size = max(len(nodes) for nodes in trees)
+        self.n_trees = len(trees)
+        # Узел t-го дерева с номером i хранится по индексу t * size + i; листья ссылаются
+        # сами на себя, поэтому лишние шаги спуска их не меняют
+        self.roots = np.arange(self.n_trees, dtype=np.int32) * size
+        node_ids = np.arange(self.n_trees * size, dtype=np.int32)
+        self.feature = np.zeros(len(node_ids), dtype=np.int32)
+        self.threshold = np.full(len(node_ids), np.inf, dtype=np.float32)
+        # children[2 * узел] — ветка «значение меньше порога», children[2 * узел + 1] — иначе
+        self.children = np.repeat(node_ids, 2)
+        self.missing = node_ids.copy()
+        self.value = np.zeros(len(node_ids))
+        self.depth = 0
+        index = {name: i for i, name in enumerate(self.feature_names)}
+        for root, nodes in zip(self.roots, trees):
+            for node_id, node in nodes.items():
+                position = root + node_id
+                if "leaf" in node:
+                    self.value[position] = node["leaf"]
+                    continue
+                self.feature[position] = index[node["split"]]
+                self.threshold[position] = node["split_condition"]
+                self.children[2 * position] = root + node["yes"]
+                self.children[2 * position + 1] = root + node["no"]
+                self.missing[position] = root + node["missing"]
+                self.depth = max(self.depth, node["depth"] + 1)
+
+    @staticmethod
+    def _flatten(tree: dict) -> dict:
+        nodes, stack = {}, [tree]
+        while stack:
+            node = stack.pop()
+            nodes[node["nodeid"]] = node
+            stack.extend(node.get("children", []))
+        return nodes
+
+    def predict_margin(self, X) -> np.ndarray:
+        # xgboost сравнивает признаки с порогами в float32
+        if isinstance(X, pd.DataFrame):
+            if list(X.columns) != self.feature_names:
+                X = X[self.feature_names]
+            X = X.to_numpy(dtype=np.float32)
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        has_missing = np.isnan(X).any()
+
+        values = X.ravel()
+        row_offsets = (np.arange(len(X), dtype=np.int32) * X.shape[1])[:, None]
+        node = np.broadcast_to(self.roots, (len(X), self.n_trees))
+        for _ in range(self.depth):
+            x = values.take(row_offsets + self.feature.take(node))
+            next_node = self.children.take(2 * node + (x >= self.threshold.take(node)))
+            if has_missing:
+                next_node = np.where(np.isnan(x), self.missing.take(node), next_node)
+            node = next_node
+        return self.value.take(node).sum(axis=1) + self.base_margin
+
+    def predict_proba(self, X) -> np.ndarray:
+        probs = 1 / (1 + np.exp(-self.predict_margin(X)))
+        return np.column_stack([1 - probs, probs])
@@ -0,0 +1,202 @@
+"""Сжатие тел запросов и ответов (gzip и zstd) для ASGI-приложения.
+
+Запрос с заголовком Content-Encoding: gzip или zstd распаковывается до передачи
+приложению в пуле потоков, чтобы не блокировать цикл событий; размер сжатого и
+распакованного тела ограничен. Тело без Content-Length (chunked) читается с подсчётом
+байт и отклоняется с 413, как только превышает max_body_bytes. Ответ сжимается, если
+клиент указал zstd или gzip в Accept-Encoding и тело не меньше minimum_size;
+потоковые ответы сжимаются по частям. Уже сжатые форматы (SKIP_CONTENT_TYPES)
+передаются как есть.
+"""
+import gzip
+import zlib
+
+import anyio
+import zstandard
+
+
+# Форматы, которые уже сжаты: повторное сжатие только тратит процессор
+SKIP_CONTENT_TYPES = ("application/vnd.apache.parquet", "application/zip", "application/gzip", "image/")
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def decompress(body: bytes, encoding: str, max_bytes: int) -> bytes:
+    """Распаковка тела запроса; BodyTooLarge, если результат больше max_bytes."""
+    if encoding == "gzip":
+        decompressor = zlib.decompressobj(wbits=31)
+        data = decompressor.decompress(body, max_bytes + 1)
+    elif encoding == "zstd":
+        with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+            data = reader.read(max_bytes + 1)
+    else:
+        raise ValueError(f"Неподдерживаемое сжатие: {encoding}")
+    if len(data) > max_bytes:
+        raise BodyTooLarge()
+    return data
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Сжатие тела (используется клиентами сервиса)."""
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    return gzip.compress(body, compresslevel=5)
+
+
+def choose_encoding(accept_encoding: str):
+    accepted = {item.split(";")[0].strip() for item in accept_encoding.lower().split(",")}
+    for encoding in ("zstd", "gzip"):
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+class StreamCompressor:
+    def __init__(self, encoding: str):
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=3).compressobj()
+            self._flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self._obj = zlib.compressobj(5, zlib.DEFLATED, 31)
+            self._flush_mode = zlib.Z_SYNC_FLUSH
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if final:
+            return self._obj.compress(data) + self._obj.flush()
+        # Сбрасываем блок, чтобы клиент потокового ответа получал данные сразу
+        return self._obj.compress(data) + self._obj.flush(self._flush_mode)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, max_body_bytes: int, max_compressed_bytes: int = None, minimum_size: int = 1024):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.max_compressed_bytes = max_compressed_bytes or max_body_bytes
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        content_encoding = headers.get("content-encoding", "").strip().lower()
+        compressed = content_encoding in ("gzip", "zstd")
+        # Размер тела без Content-Length (chunked) не проверить по заголовку — считаем байты при чтении
+        chunked = "content-length" not in headers and "chunked" in headers.get("transfer-encoding", "").lower()
+        if compressed or chunked:
+            body = await self._read_body(receive, self.max_compressed_bytes if compressed else self.max_body_bytes)
+            if body is None:
+                await self._send_error(send, 413, "Сжатое тело запроса слишком большое" if compressed
+                                       else "Тело запроса слишком большое")
+                return
+            if compressed:
+                try:
+                    body = await anyio.to_thread.run_sync(decompress, body, content_encoding, self.max_body_bytes)
+                except BodyTooLarge:
+                    await self._send_error(send, 413, "Распакованное тело запроса слишком большое")
+                    return
+                except Exception:
+                    await self._send_error(send, 400, "Не удалось распаковать тело запроса")
+                    return
+
+            removed = (b"content-encoding", b"content-length", b"transfer-encoding") if compressed \
+                else (b"content-length", b"transfer-encoding")
+            scope = dict(scope)
+            scope["headers"] = [(name, value) for name, value in scope["headers"] if name.lower() not in removed]
+            scope["headers"].append((b"content-length", str(len(body)).encode()))
+            sent = False
+
+            async def receive():
+                nonlocal sent
+                if sent:
+                    return {"type": "http.disconnect"}
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+
+        encoding = choose_encoding(headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, ResponseCompressor(send, encoding, self.minimum_size))
+
+    @staticmethod
+    async def _read_body(receive, max_bytes: int):
+        """Тело запроса целиком; None, как только прочитано больше max_bytes."""
+        chunks = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if size > max_bytes:
+                return None
+            more_body = message.get("more_body", False)
+        return b"".join(chunks)
+
+    @staticmethod
+    async def _send_error(send, status: int, detail: str):
+        body = ('{"detail": "%s"}' % detail).encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+
+class ResponseCompressor:
+    """Обёртка над send, сжимающая тело ответа."""
+
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            # Заголовки отправляем вместе с первой частью тела, когда станет ясно, сжимать ли его
+            self.start = message
+            headers = {name.lower(): value for name, value in message.get("headers", [])}
+            content_type = headers.get(b"content-type", b"").decode("latin-1")
+            self.passthrough = (b"content-encoding" in headers
+                                or content_type.startswith(SKIP_CONTENT_TYPES))
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            if self.start is not None:
+                await self.send(self.start)
+                self.start = None
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(self.start)
+                self.start = None
+                await self.send(message)
+                return
+
+            self.compressor = StreamCompressor(self.encoding)
+            headers = [(name, value) for name, value in self.start.get("headers", [])
+                       if name.lower() != b"content-length"]
+            headers += [(b"content-encoding", self.encoding.encode()), (b"vary", b"Accept-Encoding")]
+            if not more_body:
+                body = self.compressor.compress(body, final=True)
+                headers.append((b"content-length", str(len(body)).encode()))
+                await self.send({**self.start, "headers": headers})
+                self.start = None
+                await self.send({"type": "http.response.body", "body": body})
+                return
+            await self.send({**self.start, "headers": headers})
+            self.start = None
+
+        await self.send({"type": "http.response.body",
+                         "body": self.compressor.compress(body, final=not more_body),
+                         "more_body": more_body})
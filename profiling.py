@@ -0,0 +1,189 @@
+"""Профилирование отдельных запросов к скорингу по требованию.
+
+Профилирование включается заголовком X-Profile (cpu или alloc) или случайной
+выборкой с долей PROFILE_SAMPLE_RATE. Фоновый поток с заданным интервалом снимает
+стек потока, выполняющего запрос, и копит свёрнутые стеки (folded stacks) — формат,
+который принимают flamegraph.pl и speedscope. Этапы скоринга помечаются через
+stage(): метка этапа становится корнем стека. Режим alloc дополнительно собирает
+статистику выделения памяти через tracemalloc; tracemalloc общий для процесса, поэтому
+одновременно выполняется только один такой профиль, остальные запросы с alloc
+профилируются в режиме cpu. Последние PROFILE_KEEP профилей
+сохраняются в PROFILE_DIR.
+
+Когда профилирование не включено, stage() сводится к чтению thread-local атрибута.
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+
+_local = threading.local()
+# tracemalloc общий для процесса: профиль alloc может выполняться только один
+_alloc_lock = threading.Lock()
+logger = logging.getLogger("uvicorn.error")
+
+
+def profile_mode(header: str = None):
+    """Режим профилирования запроса: 'cpu', 'alloc' или None (не профилировать)."""
+    if header:
+        return "alloc" if header.strip().lower() == "alloc" else "cpu"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "cpu"
+    return None
+
+
+class RequestProfiler:
+    def __init__(self, name: str, mode: str):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.name = name
+        self.mode = mode
+        self.thread_id = threading.get_ident()
+        self.stages = ()
+        self.stage_seconds = defaultdict(float)
+        self.folded = Counter()
+        self.meta = {}
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        interval = PROFILE_INTERVAL_MS / 1000
+        while not self._stop.wait(interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            labels = [f"stage:{label}" for label in self.stages]
+            self.folded[";".join(labels + stack[::-1])] += 1
+
+    def start(self):
+        if self.mode == "alloc":
+            if tracemalloc.is_tracing() or not _alloc_lock.acquire(blocking=False):
+                self.mode = "cpu"
+                self.meta["alloc_downgraded"] = True
+            else:
+                tracemalloc.start()
+        self.started = time.perf_counter()
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        self.seconds = time.perf_counter() - self.started
+        self.allocations = None
+        if self.mode == "alloc":
+            try:
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+                _alloc_lock.release()
+            self.allocations = {
+                "peak_bytes": peak,
+                "top": [{"site": str(stat.traceback), "bytes": stat.size, "count": stat.count}
+                        for stat in snapshot.statistics("lineno")[:30]],
+            }
+
+    def save(self):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile = {
+            "id": self.id,
+            "name": self.name,
+            "mode": self.mode,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "seconds": round(self.seconds, 4),
+            "samples": sum(self.folded.values()),
+            "stages": {name: round(seconds, 4) for name, seconds in self.stage_seconds.items()},
+            "meta": self.meta,
+            "folded": dict(self.folded),
+            "allocations": self.allocations,
+        }
+        with open(os.path.join(PROFILE_DIR, f"{self.id}.json"), "w") as f:
+            json.dump(profile, f)
+
+        # Храним только последние PROFILE_KEEP профилей
+        paths = sorted((os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR)
+                        if name.endswith(".json")), key=os.path.getmtime)
+        for path in paths[:-PROFILE_KEEP]:
+            os.remove(path)
+
+
+@contextmanager
+def profile_request(name: str, mode: str = None):
+    """Профилирует блок with в текущем потоке; при mode=None ничего не делает.
+
+    Ошибка самого профилировщика записывается в лог и не влияет на ответ запроса.
+    """
+    if mode is None:
+        yield None
+        return
+
+    profiler = RequestProfiler(name, mode)
+    _local.profiler = profiler
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        _local.profiler = None
+        try:
+            profiler.stop()
+            profiler.save()
+        except Exception as e:
+            logger.warning(f"Профиль {profiler.id} не сохранён: {e}")
+
+
+@contextmanager
+def stage(name: str):
+    """Метка этапа для профиля текущего запроса (вложенные этапы допускаются)."""
+    profiler = getattr(_local, "profiler", None)
+    if profiler is None:
+        yield
+        return
+
+    profiler.stages = profiler.stages + (name,)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.stage_seconds[name] += time.perf_counter() - started
+        profiler.stages = profiler.stages[:-1]
+
+
+def list_profiles() -> list:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if name.endswith(".json"):
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                profile = json.load(f)
+            profile.pop("folded")
+            profile.pop("allocations")
+            profiles.append(profile)
+    return profiles
+
+
+def load_profile(profile_id: str) -> dict:
+    """Профиль по id; FileNotFoundError, если его нет (или id некорректен)."""
+    if os.path.basename(profile_id) != profile_id:
+        raise FileNotFoundError(profile_id)
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.json")) as f:
+        return json.load(f)
+
+
+def folded_text(profile: dict) -> str:
+    """Свёрнутые стеки в текстовом формате: 'frame;frame;frame count' по строке на стек."""
+    return "\n".join(f"{stack} {count}" for stack, count in profile["folded"].items()) + "\n"
@@ -0,0 +1,256 @@
+"""Хранилище результатов скоринга для постраничного просмотра.
+
+Результат одного прогона скоринга сохраняется под идентификатором; при сохранении
+один раз строится индекс: для каждого ключа сортировки и каждой комбинации фильтров
+по стране и предсказанию — массив позиций строк, упорядоченный по ключу. Страница
+с фильтрами по стране и предсказанию — срез готового массива, диапазон вероятности
+при сортировке по вероятности находится бинарным поиском, поэтому время получения
+страницы не зависит от числа строк. Только диапазон вероятности при сортировке по
+CustomerId требует прохода по строкам выбранной группы.
+
+Хранится не больше RESULT_STORE_MAX_RUNS прогонов, RESULT_STORE_MAX_ROWS строк и
+RESULT_STORE_MAX_MB мегабайт (результаты, индекс и сохранённые признаки); старые
+прогоны вытесняются, а также удаляются через RESULT_TTL_SECONDS. Признаки хранятся
+компактно: строковые столбцы — как category, числа — в наименьшем типе без потерь.
+
+Выгрузка (export) формируется по частям прямо из сохранённых массивов: csv_chunks и
+parquet_chunks отдают байты каждой части, не собирая файл целиком в памяти.
+"""
+import bisect
+import io
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+RESULT_STORE_MAX_RUNS = int(os.getenv("RESULT_STORE_MAX_RUNS", "8"))
+RESULT_STORE_MAX_ROWS = int(os.getenv("RESULT_STORE_MAX_ROWS", "5000000"))
+RESULT_STORE_MAX_MB = float(os.getenv("RESULT_STORE_MAX_MB", "512"))
+RESULT_TTL_SECONDS = float(os.getenv("RESULT_TTL_SECONDS", "3600"))
+
+SORT_KEYS = ("churn_probability", "CustomerId")
+
+
+class _SortedView:
+    """Значения в порядке order без копирования — для бинарного поиска через bisect.
+
+    np.searchsorted(..., sorter=order) проверяет весь order и потому линеен по числу строк.
+    """
+
+    def __init__(self, values: np.ndarray, order: np.ndarray):
+        self.values = values
+        self.order = order
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, position):
+        return self.values[self.order[position]]
+
+
+class ScoredRun:
+    def __init__(self, results: pd.DataFrame, features: pd.DataFrame = None):
+        """results — результаты скоринга; features — входные признаки тех же строк в том же порядке."""
+        self.customer_id = results["CustomerId"].to_numpy()
+        geography = pd.Categorical(results["Geography"])
+        self.countries = list(geography.categories)
+        self.geography = geography.codes
+        self.prediction = results["prediction"].to_numpy()
+        self.probability = results["churn_probability"].to_numpy()
+        self.rows = len(results)
+        self.features = _compact(features.reset_index(drop=True)) if features is not None else None
+        self.created = time.monotonic()
+
+        # orders[(ключ, код страны или None, предсказание или None)] — позиции, упорядоченные по ключу
+        self.orders = {}
+        for key in SORT_KEYS:
+            values = self.probability if key == "churn_probability" else self.customer_id
+            order = np.argsort(values, kind="stable").astype(np.int32)
+            self.orders[(key, None, None)] = order
+            by_country = {code: order[self.geography[order] == code] for code in range(len(self.countries))}
+            by_prediction = {label: order[self.prediction[order] == label] for label in (0, 1)}
+            self.orders.update({(key, code, None): part for code, part in by_country.items()})
+            self.orders.update({(key, None, label): part for label, part in by_prediction.items()})
+            for code, part in by_country.items():
+                for label in (0, 1):
+                    self.orders[(key, code, label)] = part[self.prediction[part] == label]
+
+        self.nbytes = sum(array.nbytes for array in [self.customer_id, self.geography, self.prediction,
+                                                     self.probability, *self.orders.values()])
+        if self.features is not None:
+            self.nbytes += int(self.features.memory_usage(index=False, deep=True).sum())
+
+    def page(self, offset: int, limit: int, sort_by: str = "churn_probability", descending: bool = True,
+             country: str = None, prediction: int = None, min_probability: float = None,
+             max_probability: float = None):
+        """Возвращает (число строк после фильтров, DataFrame со строками страницы)."""
+        if sort_by not in SORT_KEYS:
+            raise ValueError(f"Сортировка возможна только по {', '.join(SORT_KEYS)}")
+        if country is not None and country not in self.countries:
+            return 0, self._frame(np.empty(0, dtype=np.int32))
+        code = self.countries.index(country) if country is not None else None
+        order = self.orders[(sort_by, code, prediction)]
+
+        if min_probability is not None or max_probability is not None:
+            low = -np.inf if min_probability is None else min_probability
+            high = np.inf if max_probability is None else max_probability
+            if sort_by == "churn_probability":
+                view = _SortedView(self.probability, order)
+                order = order[bisect.bisect_left(view, low):bisect.bisect_right(view, high)]
+            else:
+                probability = self.probability[order]
+                order = order[(probability >= low) & (probability <= high)]
+
+        total = len(order)
+        if descending:
+            stop = max(total - offset, 0)
+            positions = order[max(stop - limit, 0):stop][::-1]
+        else:
+            positions = order[offset:offset + limit]
+        return total, self._frame(positions)
+
+    def top_k(self, k: int, group_by: list = None, only_churn: bool = True) -> pd.DataFrame:
+        """Топ-K строк по вероятности оттока (по убыванию) в каждой группе group_by.
+
+        Группы — Geography и сохранённые признаки. Без группировки и по стране строки
+        берутся с конца готовых упорядоченных массивов; для других группировок —
+        один проход по строкам без сортировки.
+        """
+        group_by = list(group_by or [])
+        missing = [col for col in group_by if col != "Geography" and (self.features is None
+                                                                     or col not in self.features.columns)]
+        if missing:
+            raise ValueError(f"Признаки для группировки не сохранены: {missing}")
+        label = 1 if only_churn else None
+
+        if not group_by:
+            picked = [self.orders[("churn_probability", None, label)][-k:][::-1]]
+        elif group_by == ["Geography"]:
+            picked = [self.orders[("churn_probability", code, label)][-k:][::-1]
+                      for code in range(len(self.countries))]
+        else:
+            order = self.orders[("churn_probability", None, label)]
+            keys = pd.DataFrame({col: self.geography[order] if col == "Geography"
+                                 else self.features[col].iloc[order].to_numpy() for col in group_by})
+            # Индексы групп возрастают, поэтому последние k — наибольшие вероятности
+            picked = [order[idx[-k:][::-1]]
+                      for idx in keys.groupby(group_by, sort=True, observed=True).indices.values()]
+
+        positions = np.concatenate(picked) if picked else np.empty(0, dtype=np.int32)
+        frame = self._frame(positions)
+        for col in group_by:
+            if col not in frame.columns:
+                frame[col] = self.features[col].iloc[positions].to_numpy()
+        return frame
+
+    def frames(self, chunk_rows: int, include_features: bool = False):
+        """Итератор по частям результатов (в порядке сохранения), при необходимости с признаками."""
+        for start in range(0, self.rows, chunk_rows):
+            stop = min(start + chunk_rows, self.rows)
+            frame = self._frame(np.arange(start, stop))
+            if include_features and self.features is not None:
+                frame = pd.concat([frame, self.features.iloc[start:stop].reset_index(drop=True)], axis=1)
+            yield frame
+
+    def _frame(self, positions: np.ndarray) -> pd.DataFrame:
+        return pd.DataFrame({
+            "CustomerId": self.customer_id[positions],
+            "Geography": np.array(self.countries, dtype=object)[self.geography[positions]],
+            "prediction": self.prediction[positions],
+            "churn_probability": self.probability[positions],
+        })
+
+
+def _compact(features: pd.DataFrame) -> pd.DataFrame:
+    """Строки — в category, целые — в наименьший целый тип, дробные — в float32, если это без потерь."""
+    columns = {}
+    for name, column in features.items():
+        if column.dtype == object:
+            column = column.astype("category")
+        elif pd.api.types.is_integer_dtype(column):
+            column = pd.to_numeric(column, downcast="integer")
+        elif pd.api.types.is_float_dtype(column):
+            as_float32 = column.astype(np.float32)
+            if np.array_equal(as_float32.to_numpy(np.float64), column.to_numpy(), equal_nan=True):
+                column = as_float32
+        columns[name] = column
+    return pd.DataFrame(columns)
+
+
+def csv_chunks(frames):
+    """Байты CSV по частям: заголовок — только в первой части."""
+    header = True
+    for frame in frames:
+        yield frame.to_csv(index=False, header=header).encode("utf-8")
+        header = False
+
+
+def parquet_chunks(frames):
+    """Байты Parquet по частям: каждая часть — отдельная группа строк (row group)."""
+    buffer = io.BytesIO()
+    writer = None
+    for frame in frames:
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(buffer, table.schema)
+        writer.write_table(table)
+        yield _drain(buffer)
+    if writer is not None:
+        writer.close()
+        yield _drain(buffer)
+
+
+def _drain(buffer: io.BytesIO) -> bytes:
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+class ResultStore:
+    def __init__(self, max_runs: int = RESULT_STORE_MAX_RUNS, max_rows: int = RESULT_STORE_MAX_ROWS,
+                 ttl_seconds: float = RESULT_TTL_SECONDS, max_bytes: int = int(RESULT_STORE_MAX_MB * 1024 * 1024)):
+        self.max_runs = max_runs
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.runs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, results: pd.DataFrame, features: pd.DataFrame = None) -> str:
+        """Сохраняет результаты прогона, строит индекс и возвращает идентификатор."""
+        run = ScoredRun(results, features)
+        result_id = uuid.uuid4().hex
+        with self._lock:
+            self.runs[result_id] = run
+            self._evict()
+        return result_id
+
+    def get(self, result_id: str) -> ScoredRun:
+        """Прогон по идентификатору; KeyError, если его нет или он устарел."""
+        with self._lock:
+            self._evict()
+            run = self.runs[result_id]
+            self.runs.move_to_end(result_id)
+            return run
+
+    def delete(self, result_id: str):
+        with self._lock:
+            del self.runs[result_id]
+
+    def _evict(self):
+        now = time.monotonic()
+        for result_id in [result_id for result_id, run in self.runs.items()
+                          if now - run.created > self.ttl_seconds]:
+            del self.runs[result_id]
+        # Последний добавленный прогон не вытесняется, даже если он один больше лимитов
+        while len(self.runs) > 1 and (len(self.runs) > self.max_runs
+                                      or sum(run.rows for run in self.runs.values()) > self.max_rows
+                                      or sum(run.nbytes for run in self.runs.values()) > self.max_bytes):
+            self.runs.popitem(last=False)
@@ -0,0 +1,115 @@
+"""Теневой (shadow) скоринг моделей-претендентов (challenger).
+
+Для страны, у которой есть модель-претендент, та же предобработанная матрица
+признаков после отправки ответа скорится претендентом в ограниченном фоновом
+пуле. Если очередь пула заполнена, задание отбрасывается (и учитывается в
+статистике), а не копится без ограничений; так же задание отбрасывается, пока
+сервис занят основными запросами (is_busy). По каждой паре champion/challenger
+накапливаются доля совпадений предсказаний, разница вероятностей и задержки.
+"""
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Сколько последних замеров задержки хранить для перцентилей
+LATENCY_WINDOW = 1000
+
+
+class ShadowStats:
+    def __init__(self):
+        self.batches = 0
+        self.rows = 0
+        self.agreements = 0
+        self.dropped = 0
+        self.errors = 0
+        self.sum_delta = 0.0
+        self.sum_abs_delta = 0.0
+        self.max_abs_delta = 0.0
+        self.champion_latency = deque(maxlen=LATENCY_WINDOW)
+        self.challenger_latency = deque(maxlen=LATENCY_WINDOW)
+
+    def as_dict(self) -> dict:
+        def percentiles(values):
+            if not values:
+                return None
+            p50, p99 = np.percentile(list(values), [50, 99])
+            return {"p50_ms": round(p50 * 1000, 2), "p99_ms": round(p99 * 1000, 2)}
+
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "dropped_batches": self.dropped,
+            "errors": self.errors,
+            "agreement_rate": round(self.agreements / self.rows, 4) if self.rows else None,
+            "mean_delta": round(self.sum_delta / self.rows, 4) if self.rows else None,
+            "mean_abs_delta": round(self.sum_abs_delta / self.rows, 4) if self.rows else None,
+            "max_abs_delta": round(self.max_abs_delta, 4),
+            "champion_latency": percentiles(self.champion_latency),
+            "challenger_latency": percentiles(self.challenger_latency),
+        }
+
+
+def lower_thread_priority():
+    # В Linux приоритет (nice) задаётся отдельно для каждого потока: теневые потоки
+    # получают процессорное время только тогда, когда основные запросы его не используют
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+
+class ShadowScorer:
+    def __init__(self, max_workers: int, max_pending: int, is_busy=None):
+        self.is_busy = is_busy
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shadow",
+                                           initializer=lower_thread_priority)
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.stats = defaultdict(ShadowStats)
+        self._lock = threading.Lock()
+
+    def submit(self, country: str, challenger: dict, X: pd.DataFrame, champion_probs: np.ndarray,
+               champion_threshold: float, champion_seconds: float):
+        """Ставит теневой скоринг в очередь; под нагрузкой или при заполненной очереди отбрасывает."""
+        if (self.is_busy is not None and self.is_busy()) or not self.slots.acquire(blocking=False):
+            with self._lock:
+                self.stats[country].dropped += 1
+            return
+        future = self.executor.submit(self._score, country, challenger, X, champion_probs,
+                                      champion_threshold, champion_seconds)
+        future.add_done_callback(lambda _: self.slots.release())
+
+    def submit_all(self, jobs: list):
+        for job in jobs:
+            self.submit(*job)
+
+    def _score(self, country, challenger, X, champion_probs, champion_threshold, champion_seconds):
+        started = time.perf_counter()
+        try:
+            probs = challenger["model"].predict_proba(X)[:, 1]
+        except Exception:
+            with self._lock:
+                self.stats[country].errors += 1
+            return
+        seconds = time.perf_counter() - started
+
+        agreements = int(((probs >= challenger["threshold"]) == (champion_probs >= champion_threshold)).sum())
+        delta = probs - champion_probs
+        with self._lock:
+            stats = self.stats[country]
+            stats.batches += 1
+            stats.rows += len(probs)
+            stats.agreements += agreements
+            stats.sum_delta += float(delta.sum())
+            stats.sum_abs_delta += float(np.abs(delta).sum())
+            stats.max_abs_delta = max(stats.max_abs_delta, float(np.abs(delta).max(initial=0)))
+            stats.champion_latency.append(champion_seconds)
+            stats.challenger_latency.append(seconds)
+
+    def report(self) -> dict:
+        with self._lock:
+            return {country: stats.as_dict() for country, stats in self.stats.items()}
@@ -1,8 +1,13 @@
 import io
+import os
 
 import streamlit as st
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+from http_compression import compress
 import matplotlib.pyplot as plt
 import plotly.express as px
 
@@ -14,6 +19,154 @@ st.title("📊 Прогноз оттока клиентов")
 # API_URL = "http://backend:8000"
 
 API_URL = "http://localhost:8000"
+# Адрес бэкенда, доступный из браузера пользователя (для ссылок на выгрузку результатов)
+PUBLIC_API_URL = os.getenv("PUBLIC_API_URL", API_URL)
+
+# Таймауты запросов к бэкенду: (подключение, ожидание ответа), секунды
+CONNECT_TIMEOUT = 3.05
+PREDICT_TIMEOUT = (CONNECT_TIMEOUT, 300)
+INFO_TIMEOUT = (CONNECT_TIMEOUT, 10)
+
+# Поля, которые принимает /predict_batch; остальные столбцы файла не отправляются
+API_FIELDS = [
+    "CustomerId", "Geography", "CreditScore", "Age", "Tenure", "Balance", "NumOfProducts",
+    "HasCrCard", "IsActiveMember", "EstimatedSalary", "Gender", "Gender_Male",
+]
+
+# Группировки топа-K (параметр group_by запроса /results/{id}/top_k) и подписи столбцов группировки
+TOP_K_GROUPS = {
+    "Без группировки": [],
+    "По странам": ["Geography"],
+    "По полу": ["Gender"],
+    "По числу продуктов": ["NumOfProducts"],
+    "По активности клиента": ["IsActiveMember"],
+    "По наличию кредитной карты": ["HasCrCard"],
+}
+TOP_K_GROUP_NAMES = {
+    "Gender": "Пол",
+    "NumOfProducts": "Число продуктов",
+    "IsActiveMember": "Активный клиент",
+    "HasCrCard": "Кредитная карта",
+}
+
+
+@st.cache_resource
+def get_api_session() -> requests.Session:
+    """Общая для всех перезапусков скрипта сессия с пулом keep-alive соединений."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # Сжатые ответы: запрашиваем только те кодировки, которые умеет распаковывать установленный urllib3
+    # (zstd — при наличии backports.zstd/compression.zstd, gzip — всегда)
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    return session
+
+
+def encode_clients(data: pd.DataFrame) -> bytes:
+    """Тело запроса {"clients": [...]} в JSON, сжатое zstd."""
+    columns = [column for column in API_FIELDS if column in data.columns]
+    body = '{"clients":' + data[columns].to_json(orient="records") + "}"
+    return compress(body.encode("utf-8"), "zstd")
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def fetch_feature_importances(country: str):
+    # Ошибка — исключение, а не None: иначе st.cache_data запомнит её на ttl
+    response = get_api_session().get(
+        f"{API_URL}/feature_importances", params={"country": country}, timeout=INFO_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def fetch_results_page(result_id: str, params: dict):
+    """Страница сохранённых на бэкенде результатов; None, если они устарели."""
+    response = get_api_session().get(f"{API_URL}/results/{result_id}", params=params, timeout=INFO_TIMEOUT)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()
+
+
+def fetch_top_k(result_id: str, k: int, group_by: list):
+    """Топ-K клиентов сохранённого на бэкенде прогона; None, если результаты устарели."""
+    response = get_api_session().get(f"{API_URL}/results/{result_id}/top_k",
+                                     params={"k": k, "group_by": group_by}, timeout=INFO_TIMEOUT)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()
+
+
+def show_top_k(result_id: str, rename_dict: dict):
+    """Топ-K клиентов с высоким риском оттока: выбор выполняет бэкенд по сохранённому прогону."""
+    top_k = st.number_input("Количество клиентов в топе", min_value=1, max_value=1000, value=10, step=1)
+    group_label = st.selectbox("Группировка топа", list(TOP_K_GROUPS))
+    group_by = TOP_K_GROUPS[group_label]
+    st.markdown(f"### Топ-{top_k} клиентов с высоким риском оттока")
+    st.markdown("**Легенда:** 0 — клиент останется, 1 — клиент уйдёт")
+
+    try:
+        rows = fetch_top_k(result_id, top_k, group_by)
+    except requests.RequestException as e:
+        st.error(f"Ошибка запроса: {e}")
+        return
+    if rows is None:
+        # Результаты вытеснены из хранилища бэкенда — скорим файл заново
+        st.session_state.pop("scored_data_id", None)
+        st.rerun()
+
+    columns = list(rename_dict) + [col for col in group_by if col not in rename_dict]
+    st.dataframe(
+        pd.DataFrame(rows, columns=columns).rename(columns={**TOP_K_GROUP_NAMES, **rename_dict}),
+        hide_index=True,
+    )
+
+
+def show_results_page(result_id: str, rename_dict: dict):
+    """Таблица результатов: бэкенд отдаёт только видимую страницу с учётом сортировки и фильтров."""
+    filter1, filter2, filter3 = st.columns(3)
+    country = filter1.selectbox("Страна", ["Все", "France", "Germany", "Spain"])
+    prediction = filter2.selectbox("Предсказание", ["Все", 0, 1])
+    sort_label = filter3.selectbox("Сортировка", ["Вероятность ↓", "Вероятность ↑", "ID клиента ↑", "ID клиента ↓"])
+    min_probability, max_probability = st.slider("Вероятность оттока", 0.0, 1.0, (0.0, 1.0), step=0.01)
+    page_col, size_col = st.columns(2)
+    page_size = size_col.selectbox("Строк на странице", [25, 50, 100, 250], index=1)
+    page = page_col.number_input("Страница", min_value=1, value=1, step=1)
+
+    params = {
+        "page": page,
+        "page_size": page_size,
+        "sort_by": "churn_probability" if sort_label.startswith("Вероятность") else "CustomerId",
+        "descending": sort_label.endswith("↓"),
+    }
+    if country != "Все":
+        params["country"] = country
+    if prediction != "Все":
+        params["prediction"] = prediction
+    if min_probability > 0:
+        params["min_probability"] = min_probability
+    if max_probability < 1:
+        params["max_probability"] = max_probability
+
+    try:
+        result_page = fetch_results_page(result_id, params)
+    except requests.RequestException as e:
+        st.error(f"Ошибка запроса: {e}")
+        return
+    if result_page is None:
+        # Результаты вытеснены из хранилища бэкенда — скорим файл заново
+        st.session_state.pop("scored_data_id", None)
+        st.rerun()
+
+    pages = max((result_page["total"] + page_size - 1) // page_size, 1)
+    st.caption(f"Страница {page} из {pages}, всего клиентов: {result_page['total']}")
+    st.dataframe(
+        pd.DataFrame(result_page["rows"], columns=list(rename_dict)).rename(columns=rename_dict),
+        hide_index=True,
+    )
+
 
 # Разделение на вкладки
 tab1, tab2 = st.tabs(["📤 Загрузка данных", "📈 Результаты предсказаний"])
@@ -83,6 +236,13 @@ with tab1:
             else:
                 st.success("✅ Данные успешно загружены!")
 
+                duplicated_ids = data["CustomerId"].duplicated(keep="last")
+                if duplicated_ids.any():
+                    st.warning(
+                        f"⚠️ CustomerId повторяется: {int(duplicated_ids.sum())} лишних строк. "
+                        "Для каждого клиента будет использована последняя запись."
+                    )
+
                 st.markdown("### 🔍 Часть загруженных данных:")
                 st.dataframe(data.sample(3))
 
@@ -447,6 +607,8 @@ with tab1:
                 st.session_state[
                     "raw_data"
                 ] = data  # сохраняем данные для дальнейшей обработки
+                # Идентификатор загрузки: по нему вкладка результатов понимает, что файл уже отскорен
+                st.session_state["raw_data_id"] = uploaded_file.file_id
 
         except Exception as e:
             st.error(f"Ошибка чтения файла: {e}")
@@ -458,34 +620,54 @@ with tab2:
         st.warning(error_message)
     else:
         data = st.session_state["raw_data"]
+        data_id = st.session_state.get("raw_data_id")
+
+        # Файл скорится один раз: перезапуски скрипта (листание таблицы, фильтры)
+        # используют сохранённый результат
+        if st.session_state.get("scored_data_id") != data_id:
+            # Формируем пакет данных для отправки (JSON со списком клиентов, сжатый zstd)
+            body = encode_clients(data)
+
+            try:
+                response = get_api_session().post(
+                    f"{API_URL}/predict_batch",
+                    # Повторы CustomerId отбрасываются на бэкенде: остаётся последняя запись клиента
+                    params={"store": "true", "duplicates": "keep_last"},
+                    data=body,
+                    headers={"Content-Type": "application/json", "Content-Encoding": "zstd"},
+                    timeout=PREDICT_TIMEOUT,
+                )
+                if response.status_code == 200:
+                    st.session_state["final_results"] = pd.DataFrame(response.json())
+                    st.session_state["result_id"] = response.headers.get("X-Result-Id")
+                    st.session_state["scored_data_id"] = data_id
+                else:
+                    st.error(f"Ошибка: {response.text}")
+            except Exception as e:
+                st.error(f"Ошибка запроса: {e}")
 
-        # Формируем пакет данных для отправки (список словарей)
-        payload = {"clients": data.to_dict(orient="records")}
-
-        try:
-            response = requests.post(f"{API_URL}/predict_batch", json=payload)
-            if response.status_code == 200:
-                results = response.json()
-            else:
-                st.error(f"Ошибка: {response.text}")
-                results = None
-        except Exception as e:
-            st.error(f"Ошибка запроса: {e}")
-            results = None
-
-        if results:
-            final_results = pd.DataFrame(results)
+        if st.session_state.get("scored_data_id") == data_id:
+            final_results = st.session_state["final_results"]
             st.success("✅ Предсказания завершены!")
 
-            # Возможность скачивания результатов
-            csv = final_results.to_csv(index=False).encode("utf-8")
-            st.download_button(
-                label="📥 Скачать результат (CSV)",
-                data=csv,
-                file_name="churn_predictions.csv",
-                mime="text/csv",
+            # Скачивание результатов: бэкенд формирует файл по частям только при переходе по ссылке
+            export_url = f"{PUBLIC_API_URL}/results/{st.session_state['result_id']}/export"
+            export_col1, export_col2, export_col3 = st.columns(3)
+            export_col1.link_button(
+                "📥 Скачать результат (CSV)",
+                f"{export_url}?format=csv",
                 help="Скачать результат предсказаний клиентов в формате .csv"
             )
+            export_col2.link_button(
+                "📥 Скачать результат (Parquet)",
+                f"{export_url}?format=parquet",
+                help="Скачать результат предсказаний клиентов в формате .parquet"
+            )
+            export_col3.link_button(
+                "📥 Скачать результат с признаками (CSV)",
+                f"{export_url}?format=csv&include_features=true",
+                help="Результат предсказаний вместе с исходными признаками клиентов"
+            )
 
             # Две равные колонки
             col1, col2 = st.columns(2)
@@ -504,20 +686,10 @@ with tab2:
             with col1:
                 st.markdown("### Результаты предсказаний клиентов")
                 st.markdown("**Легенда:** 0 — клиент останется, 1 — клиент уйдёт")
-                # Создаём копию с переименованными столбцами
-                final_renamed = final_results.rename(columns=rename_dict)
-                st.dataframe(final_renamed)
+                show_results_page(st.session_state["result_id"], rename_dict)
 
             with col2:
-                st.markdown("### Топ-10 клиентов с высоким риском оттока")
-                st.markdown("**Легенда:** 0 — клиент останется, 1 — клиент уйдёт")
-                top_risk = (
-                    final_results[final_results["prediction"] == 1]
-                    .sort_values("churn_probability", ascending=False)
-                    .head(10)
-                )
-                top_risk_renamed = top_risk.rename(columns=rename_dict)
-                st.dataframe(top_risk_renamed)
+                show_top_k(st.session_state["result_id"], rename_dict)
 
             st.markdown("### Распределение предсказаний по оттоку")
             churn_counts = final_results["prediction"].value_counts().sort_index()
@@ -539,22 +711,14 @@ with tab2:
 
             if "raw_data" in st.session_state:
                 raw_data = st.session_state["raw_data"]
-                # Объединяем предсказания с исходными данными по CustomerId
-                merged = pd.merge(
-                    final_results,
-                    raw_data[
-                        [
-                            "CustomerId",
-                            "Age",
-                            "NumOfProducts",
-                            "IsActiveMember",
-                            "Balance",
-                            "Gender"
-                        ]
-                    ],
-                    on="CustomerId",
-                    how="left",
-                )
+                # Присоединяем к предсказаниям исходные признаки по индексу CustomerId.
+                # CustomerId в результатах уникален (duplicates=keep_last), в индексе —
+                # та же последняя запись клиента, поэтому число строк не растёт
+                features = raw_data.loc[
+                    ~raw_data["CustomerId"].duplicated(keep="last"),
+                    ["CustomerId", "Age", "NumOfProducts", "IsActiveMember", "Balance", "Gender"],
+                ].set_index("CustomerId")
+                merged = final_results.join(features, on="CustomerId")
                 # Формируем возрастные группы
                 merged["Возрастная группа"] = pd.cut(
                     merged["Age"],
@@ -763,13 +927,12 @@ with tab2:
                 countries = ["France", "Germany", "Spain"]
                 importances_list = []
                 for country in countries:
-                    response = requests.get(
-                        f"{API_URL}/feature_importances", params={"country": country}
-                    )
-                    if response.status_code == 200:
-                        fi = (
-                            response.json()
-                        )  # fi — словарь: { "Кредитный рейтинг": value, ... }
+                    try:
+                        fi = fetch_feature_importances(country)
+                    except requests.RequestException:
+                        fi = None
+                    if fi is not None:
+                        # fi — словарь: { "Кредитный рейтинг": value, ... }
                         # Приводим значения к float, чтобы избежать проблем сериализации
                         fi = {k: float(v) for k, v in fi.items()}
                         df = pd.DataFrame(
@@ -0,0 +1,128 @@
+"""Дистилляция полных моделей в компактные для быстрого онлайн-скоринга.
+
+Для каждой страны берётся полная модель models/model_<страна>.pkl (обучена в
+eda_and_model_train.ipynb) и то же разбиение на обучение и тест, что в ноутбуке
+(train_test_split(test_size=0.3, random_state=42)). Компактная модель — небольшой
+ансамбль неглубоких деревьев — учится на вероятностях полной модели на обучающей
+выборке, дополненной синтетическими строками (часть признаков строки заменяется
+значениями из других строк), чтобы вероятности полной модели были известны и вне
+обучающих точек.
+
+Конфигурации компактной модели перебираются от самой маленькой; сохраняется первая,
+у которой ROC-AUC на тесте ниже, чем у полной модели, не больше чем на --max-auc-loss.
+Бандл models/model_<страна>_fast.pkl хранит модель, порог полной модели и метрики.
+
+Запуск из корня проекта:
+    python -m train_models.distill_models --max-auc-loss 0.01
+"""
+import argparse
+import math
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from distilled import DistilledModel
+
+FEATURES = ['CreditScore', 'Age', 'Tenure', 'Balance', 'NumOfProducts',
+            'HasCrCard', 'IsActiveMember', 'EstimatedSalary', 'Gender_Male']
+COUNTRIES = ["France", "Spain", "Germany"]
+# (глубина, число деревьев) — от самой быстрой модели к самой точной
+STUDENT_CONFIGS = [(3, 30), (3, 60), (4, 60), (4, 120), (5, 150)]
+
+
+def notebook_split(X: pd.DataFrame, y: pd.Series, test_size: float = 0.3, random_state: int = 42):
+    """То же разбиение, что train_test_split(test_size=0.3, random_state=42) из sklearn."""
+    n_test = math.ceil(test_size * len(X))
+    permutation = np.random.RandomState(random_state).permutation(len(X))
+    test, train = permutation[:n_test], permutation[n_test:]
+    return X.iloc[train], X.iloc[test], y.iloc[train], y.iloc[test]
+
+
+def roc_auc(y_true, scores) -> float:
+    ranks = pd.Series(scores).rank().to_numpy()
+    positive = np.asarray(y_true) == 1
+    n_pos, n_neg = positive.sum(), (~positive).sum()
+    return float((ranks[positive].sum() - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg))
+
+
+def augment(X: pd.DataFrame, factor: int, seed: int = 0) -> pd.DataFrame:
+    """Синтетические строки: каждый признак с вероятностью 0.5 берётся из случайной строки."""
+    rng = np.random.default_rng(seed)
+    values = X.to_numpy()
+    n = len(values) * factor
+    synthetic = values[rng.integers(0, len(values), n)]
+    replace = rng.random(synthetic.shape) < 0.5
+    donors = values[rng.integers(0, len(values), n)]
+    synthetic[replace] = donors[replace]
+    return pd.concat([X, pd.DataFrame(synthetic, columns=X.columns)], ignore_index=True)
+
+
+def distill_country(data: pd.DataFrame, country: str, max_auc_loss: float, factor: int):
+    teacher_bundle = joblib.load(f"models/model_{country.lower()}.pkl")
+    teacher, threshold = teacher_bundle["model"], teacher_bundle["threshold"]
+
+    country_data = data[data["Geography"] == country]
+    X_train, X_test, _, y_test = notebook_split(country_data[FEATURES], country_data["Exited"])
+    transfer = augment(X_train, factor)
+    soft_labels = teacher.predict_proba(transfer)[:, 1]
+    teacher_test = teacher.predict_proba(X_test)[:, 1]
+    auc_full = roc_auc(y_test, teacher_test)
+
+    for depth, n_trees in STUDENT_CONFIGS:
+        booster = xgb.train({"objective": "binary:logistic", "max_depth": depth, "eta": 0.15,
+                             "min_child_weight": 5, "seed": 42},
+                            xgb.DMatrix(transfer, label=soft_labels), num_boost_round=n_trees)
+        student = DistilledModel(booster, FEATURES)
+        student_test = student.predict_proba(X_test)[:, 1]
+        # Вычисление деревьев в numpy должно совпадать с xgboost
+        assert np.allclose(student_test, booster.predict(xgb.DMatrix(X_test)), atol=1e-5)
+
+        auc_distilled = roc_auc(y_test, student_test)
+        auc_loss = auc_full - auc_distilled
+        agreement = float(((student_test >= threshold) == (teacher_test >= threshold)).mean())
+        print(f"{country:>8}: глубина {depth}, деревьев {n_trees:>3}: ROC-AUC {auc_distilled:.4f} "
+              f"(полная {auc_full:.4f}, потеря {auc_loss:+.4f}), совпадение предсказаний {agreement:.3f}")
+        if auc_loss <= max_auc_loss:
+            return {
+                "model": student,
+                "threshold": threshold,
+                "tier": "fast",
+                "max_depth": depth,
+                "n_trees": n_trees,
+                "auc_full": round(auc_full, 4),
+                "auc_distilled": round(auc_distilled, 4),
+                "auc_loss": round(auc_loss, 4),
+                "max_auc_loss": max_auc_loss,
+                "agreement": round(agreement, 4),
+            }
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-auc-loss", type=float, default=0.01,
+                        help="допустимое снижение ROC-AUC относительно полной модели")
+    parser.add_argument("--augment", type=int, default=20,
+                        help="во сколько раз дополнить обучающую выборку синтетическими строками")
+    parser.add_argument("--countries", nargs="+", default=COUNTRIES)
+    args = parser.parse_args()
+
+    data = pd.read_csv("train_models/Churn_Modelling.csv", index_col="RowNumber")
+    data["Gender_Male"] = (data["Gender"] == "Male").astype(float)
+
+    failed = []
+    for country in args.countries:
+        bundle = distill_country(data, country, args.max_auc_loss, args.augment)
+        if bundle is None:
+            print(f"{country:>8}: ни одна компактная модель не укладывается в потерю ROC-AUC {args.max_auc_loss}")
+            failed.append(country)
+            continue
+        joblib.dump(bundle, f"models/model_{country.lower()}_fast.pkl")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()